@@ -0,0 +1,221 @@
+"""Admission control for the LLM-backed endpoints (``/api/generate-*``).
+
+Two limits are checked before a request reaches its handler:
+
+- every user has a token bucket refilled at ``ADMISSION_RATE`` requests per
+  second up to ``ADMISSION_BURST``; ``/api/generate-plan`` runs every stage
+  and costs more. Users are told apart by the user their bearer token (or
+  ``access_token`` cookie, which the Next.js proxies forward) was verified
+  to belong to. Tokens that haven't been verified yet are not trusted, since
+  a made-up token would get a fresh bucket, so those requests and anonymous
+  ones are told apart by client address.
+- at most ``ADMISSION_MAX_CONCURRENCY`` of these requests run at once in the
+  process. Up to ``ADMISSION_MAX_QUEUE`` more wait for a slot in arrival
+  order, for at most ``ADMISSION_QUEUE_TIMEOUT`` seconds.
+
+Anything over either limit is answered right away with 429 and a
+``Retry-After``, instead of piling up in front of the OpenAI rate limit. A
+slot is held until the response has been sent, so SSE streams count in full.
+"""
+
+import asyncio
+import hashlib
+import math
+import os
+import time
+from collections import deque
+from http.cookies import SimpleCookie
+
+from cache import TTLCache
+from fastapi.responses import JSONResponse
+from metrics import (
+    ADMISSION_IN_FLIGHT,
+    ADMISSION_QUEUE_DEPTH,
+    ADMISSION_QUEUE_WAIT,
+    ADMISSION_REJECTED,
+)
+from tracing import span
+
+ADMISSION = os.getenv("ADMISSION", "1") == "1"
+ADMISSION_PATH_PREFIX = "/api/generate-"
+# Per user; a rate of 0 turns the buckets off
+ADMISSION_RATE = float(os.getenv("ADMISSION_RATE", "0.5"))
+ADMISSION_BURST = float(os.getenv("ADMISSION_BURST", "10"))
+# Per process
+ADMISSION_MAX_CONCURRENCY = int(os.getenv("ADMISSION_MAX_CONCURRENCY", "32"))
+ADMISSION_MAX_QUEUE = int(os.getenv("ADMISSION_MAX_QUEUE", "64"))
+ADMISSION_QUEUE_TIMEOUT = float(os.getenv("ADMISSION_QUEUE_TIMEOUT", "10"))
+# Bucket tokens taken by one request, by path
+ADMISSION_COSTS = {"/api/generate-plan": 5}
+
+
+class Rejected(Exception):
+    def __init__(self, reason, retry_after) -> None:
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class TokenBuckets:
+    """One token bucket per key, refilled continuously.
+
+    A bucket left alone long enough to refill completely is the same as no
+    bucket, so they live in a ``TTLCache`` that forgets them after that.
+    """
+
+    def __init__(self, rate, burst, maxsize=16384, timer=time.monotonic) -> None:
+        self.rate = rate
+        self.burst = burst
+        self.timer = timer
+        self._buckets = TTLCache(maxsize=maxsize, ttl=burst / rate, timer=timer)
+
+    def take(self, key, cost=1.0):
+        """0 if ``cost`` tokens were taken, otherwise the seconds until they
+        will be available"""
+        cost = min(cost, self.burst)
+        now = self.timer()
+        tokens, updated = self._buckets.get(key, (self.burst, now))
+        tokens = min(self.burst, tokens + (now - updated) * self.rate)
+        if tokens < cost:
+            self._buckets.set(key, (tokens, now))
+            return (cost - tokens) / self.rate
+        self._buckets.set(key, (tokens - cost, now))
+        return 0.0
+
+
+class ConcurrencyLimiter:
+    """Semaphore with a bounded FIFO wait queue.
+
+    ``acquire`` raises ``Rejected`` when the queue is already full or the
+    wait times out. A released slot is handed straight to the oldest waiter,
+    so a newcomer can't overtake the queue.
+    """
+
+    def __init__(self, max_concurrency, max_queue, timeout) -> None:
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self.in_flight = 0
+        # Moving average of how long a slot is held, for Retry-After
+        self.hold_time = 1.0
+        self._waiters = deque()
+
+    @property
+    def queued(self):
+        return len(self._waiters)
+
+    def retry_after(self):
+        """Seconds until the queue has likely drained enough to get in"""
+        return self.hold_time * (self.queued + 1) / self.max_concurrency
+
+    async def acquire(self):
+        if self.in_flight < self.max_concurrency and not self._waiters:
+            self.in_flight += 1
+            ADMISSION_QUEUE_WAIT.observe(0)
+            return
+        if self.queued >= self.max_queue:
+            raise Rejected("queue_full", self.retry_after())
+        future = asyncio.get_running_loop().create_future()
+        self._waiters.append(future)
+        begin = time.perf_counter()
+        try:
+            await asyncio.wait_for(future, self.timeout)
+        except BaseException as e:
+            if future.done() and not future.cancelled():
+                # The slot was handed over just as we gave up
+                self.release()
+            elif future in self._waiters:
+                self._waiters.remove(future)
+            if isinstance(e, asyncio.TimeoutError):
+                raise Rejected("queue_timeout", self.retry_after()) from None
+            raise
+        finally:
+            ADMISSION_QUEUE_WAIT.observe(time.perf_counter() - begin)
+
+    def release(self, held=None):
+        if held is not None:
+            self.hold_time += 0.1 * (held - self.hold_time)
+        while self._waiters:
+            future = self._waiters.popleft()
+            if not future.done():
+                future.set_result(None)
+                return
+        self.in_flight -= 1
+
+    def stats(self):
+        return {
+            "in_flight": self.in_flight,
+            "queued": self.queued,
+            "max_concurrency": self.max_concurrency,
+            "max_queue": self.max_queue,
+            "hold_time": self.hold_time,
+        }
+
+
+def client_key(scope, identify=None):
+    """Who a request is rate limited as. ``identify(token_hash)`` gives the
+    verified user id of a token's SHA-256, or None."""
+    headers = dict(scope["headers"])
+    authorization = headers.get(b"authorization", b"").decode("latin-1")
+    token = None
+    if authorization.startswith("Bearer "):
+        token = authorization.split(" ")[1]
+    elif b"cookie" in headers:
+        cookie = SimpleCookie(headers[b"cookie"].decode("latin-1"))
+        if "access_token" in cookie:
+            token = cookie["access_token"].value
+    if token and identify is not None:
+        user_id = identify(hashlib.sha256(token.encode()).hexdigest())
+        if user_id is not None:
+            return f"user:{user_id}"
+    client = scope.get("client")
+    return f"addr:{client[0] if client else '-'}"
+
+
+buckets = TokenBuckets(ADMISSION_RATE, ADMISSION_BURST) if ADMISSION_RATE > 0 else None
+limiter = ConcurrencyLimiter(
+    ADMISSION_MAX_CONCURRENCY, ADMISSION_MAX_QUEUE, ADMISSION_QUEUE_TIMEOUT
+)
+ADMISSION_IN_FLIGHT.set_function(lambda: limiter.in_flight)
+ADMISSION_QUEUE_DEPTH.set_function(lambda: limiter.queued)
+
+
+class AdmissionMiddleware:
+    """ASGI middleware applying the limits above to ``/api/generate-*``.
+    ``identify`` is passed on to ``client_key``."""
+
+    def __init__(self, app, identify=None) -> None:
+        self.app = app
+        self.identify = identify
+
+    async def __call__(self, scope, receive, send):
+        if (
+            not ADMISSION
+            or scope["type"] != "http"
+            or not scope["path"].startswith(ADMISSION_PATH_PREFIX)
+        ):
+            return await self.app(scope, receive, send)
+        try:
+            if buckets is not None:
+                wait = buckets.take(
+                    client_key(scope, self.identify),
+                    ADMISSION_COSTS.get(scope["path"], 1),
+                )
+                if wait:
+                    raise Rejected("rate_limited", wait)
+            with span("admission.wait"):
+                await limiter.acquire()
+        except Rejected as e:
+            ADMISSION_REJECTED.labels(e.reason).inc()
+            response = JSONResponse(
+                {"detail": f"Too many requests ({e.reason}), retry later"},
+                status_code=429,
+                headers={"Retry-After": str(max(math.ceil(e.retry_after), 1))},
+            )
+            return await response(scope, receive, send)
+
+        begin = time.perf_counter()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            limiter.release(time.perf_counter() - begin)
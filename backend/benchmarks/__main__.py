@@ -0,0 +1,56 @@
+"""Run the backend micro-benchmarks and compare them against a baseline.
+
+From the backend directory:
+
+    python -m benchmarks run --save baseline.json
+    python -m benchmarks run --compare baseline.json
+    python -m benchmarks compare baseline.json current.json
+"""
+
+import argparse
+import sys
+
+from benchmarks import harness
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = commands.add_parser("run", help="run the benchmarks")
+    run_parser.add_argument("-k", dest="keyword", help="only names containing this")
+    run_parser.add_argument("--rounds", type=int, default=5)
+    run_parser.add_argument("--min-time", type=float, default=0.05)
+    run_parser.add_argument("--save", help="write the results to this JSON file")
+    run_parser.add_argument("--compare", help="baseline JSON file to compare with")
+    run_parser.add_argument("--threshold", type=float, default=0.10)
+
+    compare_parser = commands.add_parser("compare", help="compare two result files")
+    compare_parser.add_argument("baseline")
+    compare_parser.add_argument("current")
+    compare_parser.add_argument("--threshold", type=float, default=0.10)
+
+    args = parser.parse_args(argv)
+    if args.command == "run":
+        results = harness.run(args.keyword, args.rounds, args.min_time)
+        if args.save:
+            harness.save(results, args.save)
+        if not args.compare:
+            return 0
+        baseline = harness.load(args.compare)
+    else:
+        baseline = harness.load(args.baseline)
+        results = harness.load(args.current)
+
+    regressions = harness.compare(baseline, results, args.threshold)
+    if regressions:
+        print(
+            f"{len(regressions)} benchmark(s) regressed by more than "
+            f"{args.threshold:.0%}"
+        )
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,82 @@
+"""FastAPI handler overhead with Supabase and OpenAI replaced by in-process
+fakes; the numbers include routing, validation and serialization but no
+network."""
+
+import atexit
+
+from benchmarks import fakes
+from benchmarks.harness import parametrize
+
+fakes.setup_env()
+
+import chat
+import main
+from client import AsyncLLM
+from fastapi.testclient import TestClient
+
+_clients = {}
+
+
+def close_clients():
+    for test_client in _clients.values():
+        test_client.__exit__(None, None, None)
+    _clients.clear()
+
+
+atexit.register(close_clients)
+
+
+def client(events=100):
+    if events not in _clients:
+        close_clients()
+        main.supabase_client.transport = fakes.FakeSupabase(events).transport()
+        main.supabase_client.supabase = None
+        # Fresh uncached LLM client so every call goes through the fake API
+        chat.AsyncChatClient = AsyncLLM(transport=fakes.fake_openai_transport())
+        test_client = TestClient(main.app)
+        test_client.__enter__()
+        _clients[events] = test_client
+    return _clients[events]
+
+
+def bench_root(benchmark):
+    benchmark(client().get, "/")
+
+
+@parametrize("events", [100, 1000])
+def bench_load_data(benchmark, events):
+    benchmark(client(events).post, "/api/load-data", json={"user_id": "u1"})
+
+
+def bench_toggle_batch(benchmark):
+    body = {
+        "user_id": "u1",
+        "events": [{"event_id": i + 1, "is_done": True} for i in range(50)],
+    }
+    benchmark(client().post, "/api/events/toggle-batch", json=body)
+
+
+def bench_generate_milestones(benchmark):
+    body = {"goal": "Read more books", "status": "Reads one book a year"}
+    benchmark(client().post, "/api/generate-milestones", json=body)
+
+
+@parametrize("mode", ["llm", "local", "hybrid"])
+def bench_generate_schedules(benchmark, mode):
+    body = {
+        "missions": fakes.CANNED_OUTPUTS["MissionList"]["missions"],
+        "today": "2026-10-20",
+    }
+    benchmark(client().post, f"/api/generate-schedules?mode={mode}", json=body)
+
+
+def bench_save_data(benchmark):
+    body = {
+        "goal": "Read more books",
+        "status": "Reads one book a year",
+        "milestones": fakes.CANNED_OUTPUTS["MilestoneList"],
+        "missions": fakes.CANNED_OUTPUTS["MissionList"],
+        "schedules": fakes.CANNED_OUTPUTS["ScheduleList"],
+        "userid": "u1",
+    }
+    benchmark(client().post, "/api/save-data", json=body)
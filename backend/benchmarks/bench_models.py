@@ -0,0 +1,41 @@
+import json
+
+from benchmarks import fakes
+from benchmarks.harness import parametrize
+
+fakes.setup_env()
+
+from chat import MilestoneList, MissionList, ScheduleList
+
+FORMATS = {
+    "MilestoneList": (MilestoneList, "milestones"),
+    "MissionList": (MissionList, "missions"),
+    "ScheduleList": (ScheduleList, "events"),
+}
+
+
+def payload(name, items):
+    field = FORMATS[name][1]
+    canned = fakes.CANNED_OUTPUTS[name][field]
+    return {field: [canned[i % len(canned)] for i in range(items)]}
+
+
+@parametrize("items", [10, 200])
+@parametrize("model", list(FORMATS))
+def bench_validate_json(benchmark, model, items):
+    raw = json.dumps(payload(model, items))
+    benchmark(FORMATS[model][0].model_validate_json, raw)
+
+
+@parametrize("items", [10, 200])
+@parametrize("model", list(FORMATS))
+def bench_dump_json(benchmark, model, items):
+    result = FORMATS[model][0].model_validate(payload(model, items))
+    benchmark(result.model_dump_json)
+
+
+@parametrize("items", [10, 200])
+@parametrize("model", list(FORMATS))
+def bench_dump_dict(benchmark, model, items):
+    result = FORMATS[model][0].model_validate(payload(model, items))
+    benchmark(result.model_dump)
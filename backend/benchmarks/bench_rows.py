@@ -0,0 +1,25 @@
+from benchmarks import fakes
+from benchmarks.harness import parametrize
+
+fakes.setup_env()
+
+import util
+
+
+def schedules(n):
+    event = fakes.CANNED_OUTPUTS["ScheduleList"]["events"][0]
+    return {"events": [dict(event, summary=f"Mission {i}") for i in range(n)]}
+
+
+@parametrize("events", [10, 100, 1000])
+def bench_task_rows(benchmark, events):
+    benchmark(util.task_rows, "u1", schedules(events))
+
+
+@parametrize("milestones", [10, 100])
+def bench_milestone_rows(benchmark, milestones):
+    plan = {
+        "milestones": fakes.CANNED_OUTPUTS["MilestoneList"]["milestones"]
+        * (milestones // 5)
+    }
+    benchmark(util.milestone_rows, "u1", plan)
@@ -0,0 +1,37 @@
+"""Cold start cost, each round in a fresh interpreter: importing the app and
+getting the first response out of it (lifespan startup included)."""
+
+import os
+import subprocess
+import sys
+
+from benchmarks import fakes
+from benchmarks.harness import BACKEND_DIR
+
+fakes.setup_env()
+
+FIRST_REQUEST = """
+from fastapi.testclient import TestClient
+import main
+with TestClient(main.app) as client:
+    assert client.get("/").status_code == 200
+"""
+
+
+def python(code, **env):
+    subprocess.run(
+        [sys.executable, "-c", code],
+        cwd=BACKEND_DIR,
+        env={**os.environ, **env},
+        check=True,
+    )
+
+
+def bench_import_main(benchmark):
+    benchmark(python, "import main")
+
+
+def bench_first_request(benchmark):
+    # Without the background warm-up, which would keep the process alive
+    # until the SDK imports finish
+    benchmark(python, FIRST_REQUEST, WARM_UP="0")
@@ -0,0 +1,147 @@
+"""Check the NumPy fast path of util.task2events against dateutil and time
+both on plans with thousands of occurrences.
+
+    python benchmarks/bench_task2events.py
+
+The bench_* functions are also part of ``python -m benchmarks run``.
+"""
+
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import util
+from benchmarks.harness import parametrize
+
+RULES = [
+    "RRULE:FREQ=DAILY",
+    "RRULE:FREQ=DAILY;COUNT=10",
+    "FREQ=DAILY;INTERVAL=3;COUNT=40",
+    "RRULE:FREQ=WEEKLY",
+    "RRULE:FREQ=WEEKLY;COUNT=7",
+    "RRULE:FREQ=WEEKLY;INTERVAL=2;BYDAY=MO,WE,FR;COUNT=25",
+    "RRULE:FREQ=WEEKLY;BYDAY=SU,SA",
+    "RRULE:FREQ=WEEKLY;INTERVAL=3;BYDAY=TU,SU;WKST=SU;COUNT=30",
+    "RRULE:FREQ=WEEKLY;INTERVAL=2;BYDAY=MO,SU;WKST=SU",
+    "RRULE:FREQ=WEEKLY;INTERVAL=2;BYDAY=MO,SU",
+    # not simple, always handled by dateutil
+    "RRULE:FREQ=MONTHLY;COUNT=3",
+    "RRULE:FREQ=DAILY;BYDAY=MO;COUNT=4",
+    "RRULE:FREQ=DAILY;UNTIL=20261201T000000Z",
+]
+OFFSETS = ["+08:00", "", "Z", "-05:30"]
+
+
+def make_task(task_id, rrule_str, start, offset="+08:00", minutes=45):
+    end = start + timedelta(minutes=minutes)
+    return {
+        "id": task_id,
+        "name": f"task {task_id}",
+        "start_timestamptz": start.isoformat() + offset,
+        "end_timestamptz": end.isoformat() + offset,
+        "recurrence": rrule_str,
+    }
+
+
+SHAPES = {
+    "daily": "RRULE:FREQ=DAILY;COUNT=365",
+    "daily_open": "RRULE:FREQ=DAILY",
+    "weekly": "RRULE:FREQ=WEEKLY;COUNT=52",
+    "weekly_byday": "RRULE:FREQ=WEEKLY;BYDAY=MO,WE,FR;COUNT=150",
+    "monthly": "RRULE:FREQ=MONTHLY;COUNT=12",
+}
+UNTIL = datetime.fromisoformat("2027-10-05T00:00:00+08:00")
+
+
+@parametrize("engine", ["numpy", "dateutil"])
+@parametrize("tasks", [10, 100])
+@parametrize("shape", list(SHAPES))
+def bench_task2events(benchmark, shape, tasks, engine):
+    start = datetime(2026, 10, 5, 9, 30)
+    plan = [make_task(i, SHAPES[shape], start) for i in range(tasks)]
+    util.FAST_RRULE = engine == "numpy"
+    try:
+        benchmark(util.task2events, plan, until=UNTIL)
+    finally:
+        util.FAST_RRULE = True
+
+
+def expand(task, fast, **kwargs):
+    util.FAST_RRULE = fast
+    try:
+        return list(util.iter_task_events(task, **kwargs))
+    except Exception as e:
+        return repr(e)
+    finally:
+        util.FAST_RRULE = True
+
+
+def check_equivalence():
+    cases = mismatches = 0
+    base = datetime(2026, 10, 5, 9, 30)
+    for rrule_str in RULES:
+        for day in range(14):
+            for offset in OFFSETS:
+                task = make_task(1, rrule_str, base + timedelta(days=day), offset)
+                start = datetime.fromisoformat(task["start_timestamptz"])
+                for until in (None, start + timedelta(days=200)):
+                    for after in (None, start + timedelta(days=9, hours=1)):
+                        for limit in (util.MAX_EVENTS_PER_TASK, 5):
+                            kwargs = dict(after=after, until=until, limit=limit)
+                            cases += 1
+                            if expand(task, True, **kwargs) != expand(
+                                task, False, **kwargs
+                            ):
+                                mismatches += 1
+                                print("mismatch:", rrule_str, task, kwargs)
+    print(f"equivalence: {cases} cases, {mismatches} mismatches")
+    return mismatches == 0
+
+
+def best_of(fn, repeat=5):
+    timings = []
+    for _ in range(repeat):
+        begin = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - begin)
+    return min(timings)
+
+
+def run_benchmark():
+    start = datetime(2026, 10, 5, 9, 30)
+    until = datetime.fromisoformat("2027-10-05T00:00:00+08:00")
+    plans = {
+        "daily x50": [
+            make_task(i, "RRULE:FREQ=DAILY;COUNT=365", start) for i in range(50)
+        ],
+        "weekly byday x100": [
+            make_task(i, "RRULE:FREQ=WEEKLY;BYDAY=MO,WE,FR;COUNT=150", start)
+            for i in range(100)
+        ],
+        "mixed x200": [
+            make_task(i, RULES[i % 10], start + timedelta(hours=i % 8))
+            for i in range(200)
+        ],
+    }
+    for name, tasks in plans.items():
+        occurrences = len(util.task2events(tasks, until=until))
+        timings = {}
+        for fast in (True, False):
+            util.FAST_RRULE = fast
+            timings[fast] = best_of(lambda: util.task2events(tasks, until=until))
+        util.FAST_RRULE = True
+        print(
+            f"{name:>18}: {occurrences:6d} occurrences  "
+            f"dateutil {timings[False] * 1000:8.2f} ms  "
+            f"numpy {timings[True] * 1000:8.2f} ms  "
+            f"speedup {timings[False] / timings[True]:5.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    if not check_equivalence():
+        sys.exit(1)
+    run_benchmark()
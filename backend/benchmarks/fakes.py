@@ -0,0 +1,157 @@
+"""In-process stand-ins for Supabase (PostgREST) and the OpenAI Responses API,
+wired in through httpx mock transports so handler benchmarks measure only
+our own code."""
+
+import json
+import os
+
+import httpx
+
+ENV = {
+    "SUPABASE_URL": "http://supabase.invalid",
+    # any JWT-shaped string is accepted by the client
+    "SUPABASE_SERVICE_ROLE_KEY": "eyJhbGciOiJIUzI1NiJ9.e30.bench",
+    "OPENAI_API_KEY_CGI": "bench",
+    "SAVE_DATA_BACKGROUND": "0",
+    "JOB_QUEUE_PATH": ":memory:",
+    "PLAN_CACHE_TTL": "0",
+    # every benchmark request comes from the same client
+    "ADMISSION_RATE": "0",
+}
+
+
+def setup_env():
+    for key, value in ENV.items():
+        os.environ.setdefault(key, value)
+
+
+def event_rows(n, task_id=1):
+    return [
+        {
+            "id": i + 1,
+            "task_id": task_id,
+            "title": "Read one chapter",
+            "start": f"2026-10-{1 + i % 28:02d}T09:00:00+00:00",
+            "end": f"2026-10-{1 + i % 28:02d}T09:45:00+00:00",
+            "isDone": i % 3 == 0,
+        }
+        for i in range(n)
+    ]
+
+
+class FakeSupabase:
+    """Answers PostgREST requests with canned rows. Inserts and the save_plan
+    RPC echo their input back with ids, like ``Prefer: return=representation``.
+    """
+
+    def __init__(self, events=100) -> None:
+        self.events = event_rows(events)
+        self.requests = 0
+
+    def __call__(self, request):
+        self.requests += 1
+        table = request.url.path.rsplit("/", 1)[-1]
+        if request.method == "GET":
+            if table == "users":
+                row = {"user_id": "u1", "email": "u1@example.com", "status": "active"}
+                single = "vnd.pgrst.object" in request.headers.get("accept", "")
+                return httpx.Response(200, json=row if single else [row])
+            if table == "tasks":
+                # No tasks, so load_data has no event window to extend
+                return httpx.Response(200, json=[])
+            if "id=in." in str(request.url):
+                return httpx.Response(200, json=[{"id": e["id"]} for e in self.events])
+            return httpx.Response(200, json=self.events)
+        if request.method == "POST":
+            body = json.loads(request.content)
+            rows = body["p_tasks"] if table == "save_plan" else body
+            return httpx.Response(
+                201, json=[{**row, "id": i + 1} for i, row in enumerate(rows)]
+            )
+        return httpx.Response(200, json=[])
+
+    def transport(self):
+        return httpx.MockTransport(self)
+
+
+CANNED_OUTPUTS = {
+    "MilestoneList": {
+        "milestones": [
+            {"title": f"Milestone {i}", "description": "Finish the next part"}
+            for i in range(5)
+        ]
+    },
+    "MissionList": {
+        "missions": [
+            {"title": f"Mission {i}", "duration": 45, "recurrence": 10}
+            for i in range(8)
+        ]
+    },
+    "SummaryList": {"summaries": [f"Mission {i} session" for i in range(8)]},
+    "ScheduleList": {
+        "events": [
+            {
+                "summary": f"Mission {i}",
+                "start": {
+                    "dateTime": "2026-10-20T09:00:00+08:00",
+                    "timeZone": "Asia/Taipei",
+                },
+                "end": {
+                    "dateTime": "2026-10-20T09:45:00+08:00",
+                    "timeZone": "Asia/Taipei",
+                },
+                "recurrence": "RRULE:FREQ=DAILY;COUNT=10",
+            }
+            for i in range(8)
+        ]
+    },
+}
+
+
+def response_body(text, model="gpt-4.1-nano", status="completed"):
+    """A Responses API ``response`` object with a single output_text"""
+    output = []
+    if status == "completed":
+        output = [
+            {
+                "type": "message",
+                "id": "msg_0",
+                "role": "assistant",
+                "status": "completed",
+                "content": [{"type": "output_text", "text": text, "annotations": []}],
+            }
+        ]
+    return {
+        "id": "resp_0",
+        "object": "response",
+        "created_at": 0,
+        "model": model,
+        "status": status,
+        "output": output,
+        "parallel_tool_calls": False,
+        "tool_choice": "auto",
+        "tools": [],
+        "usage": {
+            "input_tokens": 200,
+            "input_tokens_details": {"cached_tokens": 0},
+            "output_tokens": max(len(text) // 4, 1),
+            "output_tokens_details": {"reasoning_tokens": 0},
+            "total_tokens": 200 + max(len(text) // 4, 1),
+        },
+    }
+
+
+def output_text(request_body):
+    """What the fake model answers: canned JSON for structured formats"""
+    text_format = request_body.get("text", {}).get("format", {}).get("name")
+    if text_format in CANNED_OUTPUTS:
+        return json.dumps(CANNED_OUTPUTS[text_format])
+    return "Read one book per month for the next year."
+
+
+def fake_openai_transport():
+    def handler(request):
+        body = json.loads(request.content)
+        return httpx.Response(200, json=response_body(output_text(body), body["model"]))
+
+    return httpx.MockTransport(handler)
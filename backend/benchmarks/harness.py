@@ -0,0 +1,160 @@
+"""Minimal pytest-benchmark style harness.
+
+Benchmarks are ``bench_*`` functions in ``benchmarks/bench_*.py`` that take a
+``benchmark`` argument and call ``benchmark(fn, *args, **kwargs)`` once with
+the code to time. ``@parametrize`` expands one function into several cases.
+"""
+
+import contextlib
+import importlib
+import json
+import os
+import pkgutil
+import platform
+import statistics
+import sys
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+BACKEND_DIR = os.path.dirname(BENCH_DIR)
+
+
+def parametrize(name, values):
+    def decorator(fn):
+        fn.params = getattr(fn, "params", []) + [(name, list(values))]
+        return fn
+
+    return decorator
+
+
+def _cases(fn):
+    cases = [({}, "")]
+    for name, values in reversed(getattr(fn, "params", [])):
+        cases = [
+            ({**kwargs, name: value}, f"{suffix}[{name}={value}]")
+            for value in values
+            for kwargs, suffix in cases
+        ]
+    return cases
+
+
+def discover(keyword=None):
+    """``(name, fn, kwargs)`` for every benchmark, optionally filtered"""
+    if BACKEND_DIR not in sys.path:
+        sys.path.insert(0, BACKEND_DIR)
+    found = []
+    for module_info in sorted(pkgutil.iter_modules([BENCH_DIR]), key=str):
+        if not module_info.name.startswith("bench_"):
+            continue
+        module = importlib.import_module(f"benchmarks.{module_info.name}")
+        for attr in sorted(vars(module)):
+            fn = getattr(module, attr)
+            if not attr.startswith("bench_") or not callable(fn):
+                continue
+            for kwargs, suffix in _cases(fn):
+                name = f"{module_info.name}.{attr}{suffix}"
+                if keyword is None or keyword in name:
+                    found.append((name, fn, kwargs))
+    return found
+
+
+class Benchmark:
+    """The ``benchmark`` argument: calibrates, then times ``rounds`` rounds"""
+
+    def __init__(self, rounds=5, min_time=0.05) -> None:
+        self.rounds = rounds
+        self.min_time = min_time
+        self.stats = None
+
+    def __call__(self, fn, *args, **kwargs):
+        # Keep the handlers' print() logging out of the report
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            return self._measure(fn, args, kwargs)
+
+    def _measure(self, fn, args, kwargs):
+        result = fn(*args, **kwargs)  # warm-up, also what gets returned
+        iterations = 1
+        while True:
+            elapsed = self._time(fn, args, kwargs, iterations)
+            if elapsed >= self.min_time or iterations >= 1 << 20:
+                break
+            iterations *= 2 if elapsed <= 0 else max(2, int(self.min_time / elapsed))
+        timings = [
+            self._time(fn, args, kwargs, iterations) / iterations
+            for _ in range(self.rounds)
+        ]
+        self.stats = {
+            "min": min(timings),
+            "max": max(timings),
+            "mean": statistics.mean(timings),
+            "median": statistics.median(timings),
+            "stddev": statistics.stdev(timings) if len(timings) > 1 else 0.0,
+            "rounds": self.rounds,
+            "iterations": iterations,
+        }
+        return result
+
+    @staticmethod
+    def _time(fn, args, kwargs, iterations):
+        begin = time.perf_counter()
+        for _ in range(iterations):
+            fn(*args, **kwargs)
+        return time.perf_counter() - begin
+
+
+def run(keyword=None, rounds=5, min_time=0.05):
+    results = {}
+    for name, fn, kwargs in discover(keyword):
+        benchmark = Benchmark(rounds=rounds, min_time=min_time)
+        fn(benchmark, **kwargs)
+        if benchmark.stats is None:
+            raise RuntimeError(f"{name} never called benchmark()")
+        results[name] = benchmark.stats
+        print(f"{name:<70} {format_time(benchmark.stats['median'])}")
+    return {
+        "machine": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "processor": platform.processor(),
+        },
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "benchmarks": results,
+    }
+
+
+def compare(baseline, current, threshold=0.10, stat="median"):
+    """Print a comparison table; returns the names that got slower than
+    ``threshold`` (relative) compared to the baseline"""
+    regressions = []
+    for name, stats in current["benchmarks"].items():
+        old = baseline["benchmarks"].get(name)
+        if old is None:
+            print(f"{name:<70} {format_time(stats[stat])}  (new)")
+            continue
+        change = stats[stat] / old[stat] - 1 if old[stat] else 0.0
+        flag = ""
+        if change > threshold:
+            flag = "  REGRESSION"
+            regressions.append(name)
+        print(
+            f"{name:<70} {format_time(old[stat])} -> "
+            f"{format_time(stats[stat])}  {change:+7.1%}{flag}"
+        )
+    return regressions
+
+
+def format_time(seconds):
+    for unit, scale in (("s", 1), ("ms", 1e-3), ("us", 1e-6)):
+        if seconds >= scale:
+            return f"{seconds / scale:9.3f} {unit}"
+    return f"{seconds / 1e-9:9.1f} ns"
+
+
+def load(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def save(results, path):
+    with open(path, "w") as f:
+        json.dump(results, f, indent=2, sort_keys=True)
@@ -0,0 +1,97 @@
+"""Compact prompt sections and output token budgets for the gen_* stages.
+
+Earlier stages' results are written into prompts as one short line per item
+instead of Python/Pydantic reprs, so the same plan always produces the same
+prompt (and cache key) whether it arrives as a model or as request JSON.
+``max_output_tokens`` is sized from the structure a stage is expected to
+return instead of a flat 1000, using a local token estimate.
+"""
+
+import os
+
+# Upper bound for max_output_tokens of a single call
+LLM_MAX_OUTPUT_TOKENS = int(os.getenv("LLM_MAX_OUTPUT_TOKENS", "4096"))
+# Milestone descriptions are dropped from prompts past this many tokens
+PROMPT_SECTION_TOKENS = int(os.getenv("PROMPT_SECTION_TOKENS", "1500"))
+# Missions per scheduling call; larger sets are split and run concurrently
+SCHEDULE_CHUNK_SIZE = int(os.getenv("SCHEDULE_CHUNK_SIZE", "10"))
+
+# Rough output size of one item of each structured result, JSON included
+TOKENS_PER_MILESTONE = 60
+TOKENS_PER_MISSION = 40
+TOKENS_PER_EVENT = 90
+TOKENS_PER_SUMMARY = 20
+MISSIONS_PER_MILESTONE = 3
+MAX_MILESTONES = 10
+# Wrapping object plus room for the model to be wordier than usual
+OVERHEAD_TOKENS = 50
+HEADROOM = 1.25
+
+GOAL_TOKENS = 100
+STATUS_TOKENS = 500
+
+
+def estimate_tokens(text):
+    """Token count estimate without a tokenizer: about four characters per
+    token for ASCII, one token per character for everything else (CJK)"""
+    non_ascii = sum(1 for char in text if ord(char) > 127)
+    return (len(text) - non_ascii + 3) // 4 + non_ascii
+
+
+def _items(value, field):
+    if hasattr(value, "model_dump"):
+        value = value.model_dump()
+    if isinstance(value, dict):
+        value = value.get(field, [])
+    return [
+        item.model_dump() if hasattr(item, "model_dump") else item for item in value
+    ]
+
+
+def compact_milestones(milestones, max_tokens=PROMPT_SECTION_TOKENS):
+    """One line per milestone; titles only if the descriptions make it too long"""
+    items = _items(milestones, "milestones")
+    text = "\n".join(
+        f"- {item.get('title', '')}: {item.get('description', '')}" for item in items
+    )
+    if estimate_tokens(text) > max_tokens:
+        text = "\n".join(f"- {item.get('title', '')}" for item in items)
+    return text
+
+
+def compact_missions(missions):
+    return "\n".join(
+        f"- {item.get('title', '')} ({item.get('duration', 0)} min, "
+        f"{item.get('recurrence', 1)} times)"
+        for item in _items(missions, "missions")
+    )
+
+
+def _budget(items, per_item):
+    tokens = int((items * per_item + OVERHEAD_TOKENS) * HEADROOM)
+    return max(min(tokens, LLM_MAX_OUTPUT_TOKENS), OVERHEAD_TOKENS)
+
+
+def milestones_budget():
+    return _budget(MAX_MILESTONES, TOKENS_PER_MILESTONE)
+
+
+def missions_budget(milestones):
+    count = len(_items(milestones, "milestones")) or MAX_MILESTONES
+    return _budget(count * MISSIONS_PER_MILESTONE, TOKENS_PER_MISSION)
+
+
+def schedules_budget(missions):
+    return _budget(len(_items(missions, "missions")), TOKENS_PER_EVENT)
+
+
+def summaries_budget(missions):
+    return _budget(len(missions), TOKENS_PER_SUMMARY)
+
+
+def schedule_chunks(missions):
+    """``missions`` split into sets that each fit one scheduling call"""
+    missions = _items(missions, "missions")
+    fits = int((LLM_MAX_OUTPUT_TOKENS / HEADROOM - OVERHEAD_TOKENS) // TOKENS_PER_EVENT)
+    size = max(min(SCHEDULE_CHUNK_SIZE, fits), 1)
+    return [missions[i : i + size] for i in range(0, len(missions), size)] or [[]]
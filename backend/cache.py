@@ -0,0 +1,409 @@
+import asyncio
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from functools import lru_cache
+
+MISSING = object()
+
+
+class TTLCache:
+    """Bounded LRU mapping whose entries expire after a time-to-live.
+
+    Lookups refresh an entry's LRU position but not its expiry. Values may be
+    ``None`` (used for negative caching), so use ``MISSING`` to detect misses.
+    """
+
+    def __init__(self, maxsize=1024, ttl=300.0, timer=time.monotonic) -> None:
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.timer = timer
+        self._data = OrderedDict()
+
+    def get(self, key, default=MISSING):
+        item = self._data.get(key)
+        if item is None:
+            return default
+        expires_at, value = item
+        if expires_at <= self.timer():
+            del self._data[key]
+            return default
+        self._data.move_to_end(key)
+        return value
+
+    def set(self, key, value, ttl=None):
+        ttl = self.ttl if ttl is None else ttl
+        self._data[key] = (self.timer() + ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def pop(self, key, default=None):
+        item = self._data.pop(key, None)
+        return default if item is None else item[1]
+
+    def clear(self):
+        self._data.clear()
+
+    def __contains__(self, key):
+        return self.get(key) is not MISSING
+
+    def __len__(self):
+        return len(self._data)
+
+
+class _Call:
+    def __init__(self, task) -> None:
+        self.task = task
+        self.waiters = 0
+
+
+class SingleFlight:
+    """Collapse concurrent calls with the same key into one upstream call.
+
+    The first caller for a key starts ``fn()`` as a task; callers arriving
+    while it is running await the same task. The task is only cancelled once
+    every waiter has gone away.
+    """
+
+    def __init__(self) -> None:
+        self._calls = {}
+
+    async def do(self, key, fn):
+        call = self._calls.get(key)
+        if call is None:
+            call = self._calls[key] = _Call(asyncio.ensure_future(fn()))
+            call.task.add_done_callback(lambda _: self._forget(key, call))
+        call.waiters += 1
+        try:
+            return await asyncio.shield(call.task)
+        finally:
+            call.waiters -= 1
+            if call.waiters == 0 and not call.task.done():
+                self._forget(key, call)
+                call.task.cancel()
+
+    def _forget(self, key, call):
+        if self._calls.get(key) is call:
+            del self._calls[key]
+
+    def __contains__(self, key):
+        return key in self._calls
+
+    def __len__(self):
+        return len(self._calls)
+
+
+@lru_cache(maxsize=None)
+def _schema_fingerprint(text_format):
+    if text_format is None:
+        return None
+    return json.dumps(text_format.model_json_schema(), sort_keys=True)
+
+
+class ResponseCache:
+    """Content-addressed cache for LLM responses.
+
+    Entries are keyed on everything that determines the completion (model,
+    input, temperature, max_tokens and the ``text_format`` schema). Values are
+    kept serialized: plain text as-is and structured outputs as JSON, which is
+    validated back into the ``text_format`` model on every hit so callers
+    never share a mutable instance. A bounded in-memory LRU tier sits in front
+    of an optional SQLite tier that evicts least recently used rows once the
+    stored values exceed ``max_bytes``.
+    """
+
+    def __init__(self, maxsize=256, path=None, max_bytes=64 * 1024 * 1024) -> None:
+        self.memory = TTLCache(maxsize=maxsize, ttl=float("inf"))
+        self.path = path
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.disk_hits = 0
+        self._lock = threading.Lock()
+        # SQLite work runs in worker threads, serialised by its own lock so
+        # that memory hits never wait for it
+        self._db_lock = threading.Lock()
+        # key -> last access time of disk hits not yet written
+        self._accessed = {}
+        self._bytes = 0
+        self._db = None
+        if path:
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, "
+                "size INTEGER NOT NULL, accessed REAL NOT NULL)"
+            )
+            self._db.commit()
+            (self._bytes,) = self._db.execute(
+                "SELECT COALESCE(SUM(size), 0) FROM responses"
+            ).fetchone()
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            maxsize=int(os.getenv("LLM_CACHE_SIZE", "256")),
+            path=os.getenv("LLM_CACHE_PATH") or None,
+            max_bytes=int(os.getenv("LLM_CACHE_MAX_BYTES", str(64 * 1024 * 1024))),
+        )
+
+    @staticmethod
+    def key(model, message, temperature, max_tokens, text_format=None):
+        payload = json.dumps(
+            [
+                model,
+                message,
+                temperature,
+                max_tokens,
+                _schema_fingerprint(text_format),
+            ],
+            sort_keys=True,
+            default=str,
+        )
+        return hashlib.sha256(payload.encode()).hexdigest()
+
+    def get(self, key, text_format=None):
+        raw = self._memory_get(key)
+        if raw is MISSING and self._db is not None:
+            raw = self._disk_get(key)
+        return self._result(raw, text_format)
+
+    async def aget(self, key, text_format=None):
+        """``get`` for the event loop: the SQLite tier is read in a thread"""
+        raw = self._memory_get(key)
+        if raw is MISSING and self._db is not None:
+            raw = await asyncio.to_thread(self._disk_get, key)
+        return self._result(raw, text_format)
+
+    def set(self, key, value):
+        raw = self._store_memory(key, value)
+        if self._db is not None:
+            self._disk_set(key, raw)
+
+    async def aset(self, key, value):
+        """``set`` for the event loop: the SQLite tier is written in a thread"""
+        raw = self._store_memory(key, value)
+        if self._db is not None:
+            await asyncio.to_thread(self._disk_set, key, raw)
+
+    def _memory_get(self, key):
+        with self._lock:
+            return self.memory.get(key)
+
+    def _store_memory(self, key, value):
+        raw = value if isinstance(value, str) else value.model_dump_json()
+        with self._lock:
+            self.memory.set(key, raw)
+        return raw
+
+    def _result(self, raw, text_format):
+        with self._lock:
+            if raw is MISSING:
+                self.misses += 1
+                return MISSING
+            self.hits += 1
+        if text_format is not None:
+            return text_format.model_validate_json(raw)
+        return raw
+
+    def _disk_get(self, key):
+        with self._db_lock:
+            row = self._db.execute(
+                "SELECT value FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return MISSING
+            # Written with the next set instead of a commit per hit
+            self._accessed[key] = time.time()
+        with self._lock:
+            self.disk_hits += 1
+            self.memory.set(key, row[0])
+        return row[0]
+
+    def _disk_set(self, key, raw):
+        size = len(raw.encode())
+        with self._db_lock:
+            old = self._db.execute(
+                "SELECT size FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            self._db.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?)",
+                (key, raw, size, time.time()),
+            )
+            self._accessed.pop(key, None)
+            self._bytes += size - (old[0] if old else 0)
+            self._flush_accessed()
+            if self._bytes > self.max_bytes:
+                self._evict()
+            self._db.commit()
+
+    def _flush_accessed(self):
+        if self._accessed:
+            self._db.executemany(
+                "UPDATE responses SET accessed = ? WHERE key = ?",
+                [(accessed, key) for key, accessed in self._accessed.items()],
+            )
+            self._accessed.clear()
+
+    def _evict(self):
+        rows = self._db.execute(
+            "SELECT key, size FROM responses ORDER BY accessed"
+        ).fetchall()
+        stale = []
+        for key, size in rows:
+            if self._bytes <= self.max_bytes:
+                break
+            stale.append((key,))
+            self._bytes -= size
+        self._db.executemany("DELETE FROM responses WHERE key = ?", stale)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "disk_hits": self.disk_hits,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+            "memory_entries": len(self.memory),
+        }
+
+    def close(self):
+        if self._db is not None:
+            with self._db_lock:
+                self._flush_accessed()
+                self._db.commit()
+                self._db.close()
+                self._db = None
+
+
+class MemoryBackend:
+    """In-process store for ``PlanCache``: string values, per-key TTL and
+    LRU eviction once the stored values exceed ``max_bytes``."""
+
+    def __init__(self, max_bytes=32 * 1024 * 1024, timer=time.monotonic) -> None:
+        self.max_bytes = max_bytes
+        self.timer = timer
+        self.size = 0
+        self.evictions = 0
+        self._data = OrderedDict()
+
+    async def get(self, key):
+        item = self._data.get(key)
+        if item is None:
+            return None
+        expires_at, value = item
+        if expires_at <= self.timer():
+            self._remove(key)
+            return None
+        self._data.move_to_end(key)
+        return value
+
+    async def set(self, key, value, ttl):
+        self._remove(key)
+        self._data[key] = (self.timer() + ttl, value)
+        self.size += len(value)
+        while self.size > self.max_bytes and self._data:
+            self._remove(next(iter(self._data)))
+            self.evictions += 1
+
+    def _remove(self, key):
+        item = self._data.pop(key, None)
+        if item is not None:
+            self.size -= len(item[1])
+
+    async def aclose(self):
+        self._data.clear()
+        self.size = 0
+
+
+class RedisBackend:
+    """Shared store for ``PlanCache`` so several workers see the same entries
+    and invalidations. Needs the optional ``redis`` package."""
+
+    def __init__(self, url) -> None:
+        import redis.asyncio
+
+        self.redis = redis.asyncio.from_url(url, decode_responses=True)
+        self.evictions = 0
+
+    async def get(self, key):
+        return await self.redis.get(key)
+
+    async def set(self, key, value, ttl):
+        await self.redis.set(key, value, px=max(int(ttl * 1000), 1))
+
+    async def aclose(self):
+        await self.redis.aclose()
+
+
+class PlanCache:
+    """Per-user read-through cache for rows read from Supabase.
+
+    Every user has a random generation token that is part of all their keys.
+    ``invalidate`` replaces the token, which makes every cached entry of that
+    user unreachable at once (they then age out), without having to know or
+    scan the keys. Losing the token to eviction has the same effect.
+    """
+
+    def __init__(self, backend, ttl=30.0) -> None:
+        self.backend = backend
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+
+    @classmethod
+    def from_env(cls):
+        url = os.getenv("PLAN_CACHE_URL")
+        if url:
+            backend = RedisBackend(url)
+        else:
+            backend = MemoryBackend(
+                max_bytes=int(os.getenv("PLAN_CACHE_MAX_BYTES", str(32 * 1024 * 1024)))
+            )
+        return cls(backend, ttl=float(os.getenv("PLAN_CACHE_TTL", "30")))
+
+    async def _generation(self, user_id):
+        key = f"plan:{user_id}:gen"
+        generation = await self.backend.get(key)
+        if generation is None:
+            generation = os.urandom(8).hex()
+            # Outlive the entries so they can't be orphaned early
+            await self.backend.set(key, generation, self.ttl * 2)
+        return generation
+
+    async def get_or_load(self, user_id, part, load):
+        """Cached ``part`` of a user's data, calling ``load()`` on a miss.
+
+        The value is stored under the generation seen before loading, so a
+        write that invalidates while ``load`` runs can't be masked by it.
+        """
+        generation = await self._generation(user_id)
+        key = f"plan:{user_id}:{generation}:{part}"
+        raw = await self.backend.get(key)
+        if raw is not None:
+            self.hits += 1
+            return json.loads(raw)
+        self.misses += 1
+        value = await load()
+        await self.backend.set(key, json.dumps(value), self.ttl)
+        return value
+
+    async def invalidate(self, user_id):
+        await self.backend.set(f"plan:{user_id}:gen", os.urandom(8).hex(), self.ttl * 2)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+            "evictions": self.backend.evictions,
+        }
+
+    async def aclose(self):
+        await self.backend.aclose()
@@ -1,10 +1,17 @@
-from datetime import datetime
+import asyncio
+from datetime import datetime, timezone
 
+import budget
 import prompts
-from client import LLM
+import scheduler
+from cache import ResponseCache
+from client import LLM, AsyncLLM
 from pydantic import BaseModel
 
-ChatClient = LLM("gpt-4.1-nano")
+# shared by both clients so the CLI flow and the API warm the same cache
+ResponseCacheStore = ResponseCache.from_env()
+ChatClient = LLM("gpt-4.1-nano", cache=ResponseCacheStore)
+AsyncChatClient = AsyncLLM("gpt-4.1-nano", cache=ResponseCacheStore)
 
 # procedure:
 # 1. get_goal: get the goal from the user
@@ -47,14 +54,16 @@ class ScheduleList(BaseModel):
     events: list[Schedule]
 
 
-def gen_goal(goal):
-    message = [{"role": "user", "content": prompts.gen_goal_prompt.format(goal=goal)}]
-    response = ChatClient.chat(message)
-    return response
+class SummaryList(BaseModel):
+    summaries: list[str]
 
 
-def gen_status(goal, previous_status="None", user_description="None"):
-    message = [
+def goal_message(goal):
+    return [{"role": "user", "content": prompts.gen_goal_prompt.format(goal=goal)}]
+
+
+def status_message(goal, previous_status="None", user_description="None"):
+    return [
         {
             "role": "user",
             "content": prompts.gen_status_prompt.format(
@@ -64,47 +73,266 @@ def gen_status(goal, previous_status="None", user_description="None"):
             ),
         }
     ]
-    response = ChatClient.chat(message)
-    return response
 
 
-def gen_milestones(goal, status):
-    message = [
+def milestones_message(goal, status):
+    return [
         {
             "role": "user",
             "content": prompts.gen_milestone_prompt.format(goal=goal, status=status),
         }
     ]
-    response = ChatClient.chat(message, text_format=MilestoneList)
-    return response
 
 
-def gen_missions(goal, status, milestones):
-    message = [
+def missions_message(goal, status, milestones):
+    return [
         {
             "role": "user",
             "content": prompts.gen_mission_prompt.format(
-                goal=goal, status=status, milestones=milestones
+                goal=goal,
+                status=status,
+                milestones=budget.compact_milestones(milestones),
             ),
         }
     ]
-    response = ChatClient.chat(message, text_format=MissionList)
-    return response
 
 
-def gen_schedules(missions, today):
-    message = [
+def summaries_message(missions):
+    return [
+        {
+            "role": "user",
+            "content": prompts.gen_summary_prompt.format(
+                missions=[mission["title"] for mission in missions]
+            ),
+        }
+    ]
+
+
+def schedules_message(missions, today):
+    return [
         {
             "role": "user",
             "content": prompts.gen_schedule_prompt.format(
-                missions=missions, today=today
+                missions=budget.compact_missions(missions), today=today
             ),
         }
     ]
-    response = ChatClient.chat(message, text_format=ScheduleList)
+
+
+def gen_goal(goal):
+    response = ChatClient.chat(
+        goal_message(goal), max_tokens=budget.GOAL_TOKENS, stage="goal"
+    )
+    return response
+
+
+def gen_status(goal, previous_status="None", user_description="None"):
+    response = ChatClient.chat(
+        status_message(goal, previous_status, user_description),
+        max_tokens=budget.STATUS_TOKENS,
+        stage="status",
+    )
+    return response
+
+
+def gen_milestones(goal, status):
+    response = ChatClient.chat(
+        milestones_message(goal, status),
+        text_format=MilestoneList,
+        max_tokens=budget.milestones_budget(),
+        stage="milestones",
+    )
+    return response
+
+
+def gen_missions(goal, status, milestones):
+    response = ChatClient.chat(
+        missions_message(goal, status, milestones),
+        text_format=MissionList,
+        max_tokens=budget.missions_budget(milestones),
+        stage="missions",
+    )
+    return response
+
+
+def gen_schedules(missions, today):
+    results = [
+        ChatClient.chat(
+            schedules_message(chunk, today),
+            text_format=ScheduleList,
+            max_tokens=budget.schedules_budget(chunk),
+            stage="schedules",
+        )
+        for chunk in budget.schedule_chunks(missions)
+    ]
+    return merge_schedules(results)
+
+
+def merge_schedules(results):
+    """One ScheduleList from the chunks' results. Chunks are scheduled
+    without knowing about each other, so events that overlap an earlier
+    chunk's are moved to free slots."""
+    if len(results) == 1:
+        return results[0]
+    events = [event.model_dump() for result in results for event in result.events]
+    return ScheduleList.model_validate({"events": scheduler.resolve_overlaps(events)})
+
+
+# async counterparts used by the FastAPI endpoints
+
+
+async def agen_goal(goal):
+    response = await AsyncChatClient.chat(
+        goal_message(goal), max_tokens=budget.GOAL_TOKENS, stage="goal"
+    )
+    return response
+
+
+async def agen_status(goal, previous_status="None", user_description="None"):
+    response = await AsyncChatClient.chat(
+        status_message(goal, previous_status, user_description),
+        max_tokens=budget.STATUS_TOKENS,
+        stage="status",
+    )
     return response
 
 
+async def agen_milestones(goal, status):
+    response = await AsyncChatClient.chat(
+        milestones_message(goal, status),
+        text_format=MilestoneList,
+        max_tokens=budget.milestones_budget(),
+        stage="milestones",
+    )
+    return response
+
+
+async def agen_missions(goal, status, milestones):
+    response = await AsyncChatClient.chat(
+        missions_message(goal, status, milestones),
+        text_format=MissionList,
+        max_tokens=budget.missions_budget(milestones),
+        stage="missions",
+    )
+    return response
+
+
+async def agen_schedules(missions, today):
+    """Large mission sets are scheduled in several smaller calls at once,
+    which also finishes sooner than one long completion"""
+    results = await asyncio.gather(
+        *[
+            AsyncChatClient.chat(
+                schedules_message(chunk, today),
+                text_format=ScheduleList,
+                max_tokens=budget.schedules_budget(chunk),
+                stage="schedules",
+            )
+            for chunk in budget.schedule_chunks(missions)
+        ]
+    )
+    return merge_schedules(results)
+
+
+async def agen_schedules_local(missions, today, summaries=False):
+    """Schedules from the deterministic scheduler. With ``summaries`` the LLM
+    only writes the event titles, which keeps the call small."""
+    missions = [Mission.model_validate(mission).model_dump() for mission in missions]
+    schedules = ScheduleList.model_validate(
+        scheduler.schedule_missions(missions, today)
+    )
+    if summaries and missions:
+        response = await AsyncChatClient.chat(
+            summaries_message(missions),
+            text_format=SummaryList,
+            max_tokens=budget.summaries_budget(missions),
+            stage="summaries",
+        )
+        # Keep the mission titles if the model lost count
+        if len(response.summaries) == len(schedules.events):
+            for event, summary in zip(schedules.events, response.summaries):
+                event.summary = summary
+    return schedules
+
+
+def today_utc():
+    # The web app sends new Date().toISOString()'s date, which is in UTC
+    return datetime.now(timezone.utc).strftime("%Y-%m-%d")
+
+
+async def agen_plan(goal, previous_status="None", user_description="None", today=None):
+    """Run the whole onboarding chain, yielding ``(stage, result)`` pairs as
+    each stage finishes. Mirrors ``first_time_user_flow``."""
+    today = today or today_utc()
+    goal = await agen_goal(goal)
+    yield "goal", goal
+    status = await agen_status(goal, previous_status, user_description)
+    yield "status", status
+    milestones = await agen_milestones(goal, status)
+    yield "milestones", milestones
+    missions = await agen_missions(goal, status, milestones)
+    yield "missions", missions
+    schedules = await agen_schedules(missions.missions, today)
+    yield "schedules", schedules
+
+
+# streaming variants yield text deltas; structured formats stream raw JSON
+
+
+def astream_goal(goal):
+    return AsyncChatClient.stream(
+        goal_message(goal), max_tokens=budget.GOAL_TOKENS, stage="goal"
+    )
+
+
+def astream_status(goal, previous_status="None", user_description="None"):
+    return AsyncChatClient.stream(
+        status_message(goal, previous_status, user_description),
+        max_tokens=budget.STATUS_TOKENS,
+        stage="status",
+    )
+
+
+def astream_milestones(goal, status):
+    return AsyncChatClient.stream(
+        milestones_message(goal, status),
+        text_format=MilestoneList,
+        max_tokens=budget.milestones_budget(),
+        stage="milestones",
+    )
+
+
+def astream_missions(goal, status, milestones):
+    return AsyncChatClient.stream(
+        missions_message(goal, status, milestones),
+        text_format=MissionList,
+        max_tokens=budget.missions_budget(milestones),
+        stage="missions",
+    )
+
+
+def astream_schedules(missions, today):
+    chunks = budget.schedule_chunks(missions)
+    if len(chunks) > 1:
+        return _astream_result(agen_schedules(missions, today))
+    return AsyncChatClient.stream(
+        schedules_message(missions, today),
+        text_format=ScheduleList,
+        max_tokens=budget.schedules_budget(missions),
+        stage="schedules",
+    )
+
+
+async def _astream_result(result):
+    """Yield a result that can't be streamed as a single chunk of JSON"""
+    result = await result
+    yield result.model_dump_json()
+
+
+def astream_schedules_local(missions, today, summaries=False):
+    return _astream_result(agen_schedules_local(missions, today, summaries))
+
+
 def first_time_user_flow():
     today = datetime.now().strftime("%Y-%m-%d")
     i_goal = input("Please describe your goal: ")
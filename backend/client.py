@@ -1,55 +1,404 @@
+import asyncio
 import os
+import random
+import time
+from functools import cached_property
 
-import openai
+import httpx
+from cache import MISSING, ResponseCache, SingleFlight
 from dotenv import load_dotenv
+from metrics import (
+    LLM_DEDUP,
+    SUPABASE_EVENT_HOOKS,
+    observe_llm_error,
+    observe_llm_response,
+)
 from pydantic import BaseModel
-from supabase import Client, create_client
+from tracing import SUPABASE_TRACE_HOOKS, record
+
+# openai and supabase take most of the app's import time, so they are only
+# imported when the first client is built
 
 load_dotenv()
 
 
+def _llm_succeeded(stage, model, begin, started, usage):
+    """Metrics and trace span for a finished completion request"""
+    observe_llm_response(stage, model, time.perf_counter() - begin, usage)
+    record(
+        f"llm.chat {stage}",
+        started,
+        time.time_ns(),
+        model=model,
+        input_tokens=usage.input_tokens if usage else 0,
+        output_tokens=usage.output_tokens if usage else 0,
+    )
+
+
+def _llm_failed(stage, model, started, error):
+    observe_llm_error(stage, model, error)
+    record(
+        f"llm.chat {stage}",
+        started,
+        time.time_ns(),
+        model=model,
+        error=type(error).__name__,
+    )
+
+
 class damy_format(BaseModel):
     cat_name: str
     cat_sex: str
 
 
 class LLM:
-    def __init__(self, model="gpt-4.1-nano") -> None:
+    def __init__(self, model="gpt-4.1-nano", cache=None) -> None:
+        self.model = model
+        self.cache = cache
+
+    @cached_property
+    def client(self):
+        import openai
+
         OPENAI_API_KEY_CGI = os.getenv("OPENAI_API_KEY_CGI")
-        self.client = openai.OpenAI(api_key=OPENAI_API_KEY_CGI)
+        return openai.OpenAI(api_key=OPENAI_API_KEY_CGI)
+
+    def chat(
+        self, message, temperature=0.0, max_tokens=1000, text_format=None, stage="chat"
+    ):
+        if self.cache is None:
+            return self._chat(message, temperature, max_tokens, text_format, stage)
+        key = self.cache.key(self.model, message, temperature, max_tokens, text_format)
+        res_text = self.cache.get(key, text_format)
+        if res_text is MISSING:
+            res_text = self._chat(message, temperature, max_tokens, text_format, stage)
+            self.cache.set(key, res_text)
+        return res_text
+
+    def _chat(self, message, temperature, max_tokens, text_format, stage):
+        begin, started = time.perf_counter(), time.time_ns()
+        try:
+            if text_format is not None:
+                response = self.client.responses.parse(
+                    model=self.model,
+                    input=message,
+                    temperature=temperature,
+                    max_output_tokens=max_tokens,
+                    text_format=text_format,
+                )
+                res_text = response.output_parsed
+            else:
+                response = self.client.responses.create(
+                    model=self.model,
+                    input=message,
+                    temperature=temperature,
+                    max_output_tokens=max_tokens,
+                )
+                res_text = response.output[0].content[0].text
+        except Exception as e:
+            _llm_failed(stage, self.model, started, e)
+            raise
+        _llm_succeeded(stage, self.model, begin, started, response.usage)
+        return res_text
+
+
+class AsyncLLM:
+    """Async counterpart of ``LLM`` for use inside the FastAPI event loop.
+
+    At most ``max_concurrency`` completions are in flight at once and they
+    share one pooled HTTP client. Rate limits (429), server errors (5xx) and
+    connection failures are retried with exponential backoff and jitter,
+    honouring ``Retry-After`` when the API sends it. Identical ``chat()``
+    calls made while one is already in flight share its upstream request.
+    """
+
+    def __init__(
+        self,
+        model="gpt-4.1-nano",
+        max_concurrency=None,
+        timeout=None,
+        max_retries=None,
+        backoff=0.5,
+        max_backoff=20.0,
+        cache=None,
+        transport=None,
+    ) -> None:
+        max_concurrency = max_concurrency or int(os.getenv("LLM_MAX_CONCURRENCY", "16"))
+        self.timeout = timeout or float(os.getenv("LLM_TIMEOUT", "60"))
+        self.max_retries = (
+            max_retries
+            if max_retries is not None
+            else int(os.getenv("LLM_MAX_RETRIES", "3"))
+        )
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.max_concurrency = max_concurrency
+        self.transport = transport
+        self.http_client = None
+        self.semaphore = asyncio.Semaphore(max_concurrency)
+        self.flight = SingleFlight()
         self.model = model
+        self.cache = cache
 
-    def chat(self, message, temperature=0.0, max_tokens=1000, text_format=None):
-        if text_format is not None:
-            response = self.client.responses.parse(
-                model=self.model,
-                input=message,
-                temperature=temperature,
-                max_output_tokens=max_tokens,
-                text_format=text_format,
-            )
-            res_text = response.output_parsed
-        else:
-            response = self.client.responses.create(
-                model=self.model,
-                input=message,
-                temperature=temperature,
-                max_output_tokens=max_tokens,
+    @cached_property
+    def client(self):
+        import openai
+
+        OPENAI_API_KEY_CGI = os.getenv("OPENAI_API_KEY_CGI")
+        self.http_client = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=self.max_concurrency,
+                max_keepalive_connections=self.max_concurrency,
+            ),
+            transport=self.transport,
+        )
+        # Retries are handled here so that backoff happens outside the semaphore
+        return openai.AsyncOpenAI(
+            api_key=OPENAI_API_KEY_CGI,
+            http_client=self.http_client,
+            timeout=self.timeout,
+            max_retries=0,
+        )
+
+    @cached_property
+    def RETRYABLE_ERRORS(self):
+        import openai
+
+        return (
+            openai.RateLimitError,
+            openai.InternalServerError,
+            openai.APIConnectionError,
+        )
+
+    async def chat(
+        self,
+        message,
+        temperature=0.0,
+        max_tokens=1000,
+        text_format=None,
+        timeout=None,
+        stage="chat",
+    ):
+        key = ResponseCache.key(
+            self.model, message, temperature, max_tokens, text_format
+        )
+        if self.cache is not None:
+            res_text = await self.cache.aget(key, text_format)
+            if res_text is not MISSING:
+                return res_text
+
+        async def generate():
+            res_text = await self._chat_with_retry(
+                message, temperature, max_tokens, text_format, timeout, stage
             )
-            res_text = response.output[0].content[0].text
+            if self.cache is not None:
+                await self.cache.aset(key, res_text)
+            return res_text
+
+        LLM_DEDUP.labels(stage, "shared" if key in self.flight else "upstream").inc()
+        # The upstream call is only cancelled once every caller waiting on
+        # it has been cancelled
+        res_text = await self.flight.do(key, generate)
+        if text_format is not None:
+            # Callers sharing a result must not share a mutable instance
+            res_text = res_text.model_copy(deep=True)
+        return res_text
+
+    async def _chat_with_retry(
+        self, message, temperature, max_tokens, text_format, timeout, stage
+    ):
+        attempt = 0
+        while True:
+            try:
+                async with self.semaphore:
+                    return await self._chat(
+                        message, temperature, max_tokens, text_format, timeout, stage
+                    )
+            except self.RETRYABLE_ERRORS as e:
+                if attempt >= self.max_retries:
+                    raise
+                await asyncio.sleep(self._retry_delay(attempt, e))
+                attempt += 1
+
+    async def _chat(
+        self, message, temperature, max_tokens, text_format, timeout, stage
+    ):
+        timeout = timeout or self.timeout
+        begin, started = time.perf_counter(), time.time_ns()
+        try:
+            if text_format is not None:
+                response = await self.client.responses.parse(
+                    model=self.model,
+                    input=message,
+                    temperature=temperature,
+                    max_output_tokens=max_tokens,
+                    text_format=text_format,
+                    timeout=timeout,
+                )
+                res_text = response.output_parsed
+            else:
+                response = await self.client.responses.create(
+                    model=self.model,
+                    input=message,
+                    temperature=temperature,
+                    max_output_tokens=max_tokens,
+                    timeout=timeout,
+                )
+                res_text = response.output[0].content[0].text
+        except Exception as e:
+            _llm_failed(stage, self.model, started, e)
+            raise
+        _llm_succeeded(stage, self.model, begin, started, response.usage)
         return res_text
 
+    async def stream(
+        self,
+        message,
+        temperature=0.0,
+        max_tokens=1000,
+        text_format=None,
+        timeout=None,
+        stage="chat",
+    ):
+        """Yield the completion text as it is generated.
+
+        Cache hits are yielded as a single chunk. Failures are only retried
+        while nothing has been yielded yet.
+        """
+        key = None
+        if self.cache is not None:
+            key = self.cache.key(
+                self.model, message, temperature, max_tokens, text_format
+            )
+            cached = await self.cache.aget(key, text_format)
+            if cached is not MISSING:
+                yield cached if text_format is None else cached.model_dump_json()
+                return
+
+        kwargs = {"text_format": text_format} if text_format is not None else {}
+        chunks = []
+        attempt = 0
+        while True:
+            begin, started = time.perf_counter(), time.time_ns()
+            try:
+                async with self.semaphore:
+                    async with self.client.responses.stream(
+                        model=self.model,
+                        input=message,
+                        temperature=temperature,
+                        max_output_tokens=max_tokens,
+                        timeout=timeout or self.timeout,
+                        **kwargs,
+                    ) as response_stream:
+                        async for event in response_stream:
+                            if event.type == "response.output_text.delta":
+                                chunks.append(event.delta)
+                                yield event.delta
+                        response = await response_stream.get_final_response()
+                _llm_succeeded(stage, self.model, begin, started, response.usage)
+                break
+            except Exception as e:
+                _llm_failed(stage, self.model, started, e)
+                if (
+                    not isinstance(e, self.RETRYABLE_ERRORS)
+                    or chunks
+                    or attempt >= self.max_retries
+                ):
+                    raise
+                await asyncio.sleep(self._retry_delay(attempt, e))
+                attempt += 1
+
+        if key is not None:
+            res_text = "".join(chunks)
+            if text_format is not None:
+                res_text = text_format.model_validate_json(res_text)
+            await self.cache.aset(key, res_text)
+
+    def _retry_delay(self, attempt, error):
+        response = getattr(error, "response", None)
+        retry_after = response.headers.get("retry-after") if response else None
+        if retry_after:
+            try:
+                return min(float(retry_after), self.max_backoff)
+            except ValueError:
+                pass
+        delay = min(self.backoff * 2**attempt, self.max_backoff)
+        return delay * random.uniform(0.5, 1.0)
+
+    async def aclose(self):
+        if "client" in self.__dict__:
+            await self.client.close()
+
 
 class SupabaseClient:
     def __init__(self) -> None:
         SUPABASE_URL = os.getenv("SUPABASE_URL")
         SUPABASE_SERVICE_ROLE_KEY = os.getenv("SUPABASE_SERVICE_ROLE_KEY")
-        self.supabase: Client = create_client(SUPABASE_URL, SUPABASE_SERVICE_ROLE_KEY)
+        from supabase import create_client
+
+        self.supabase = create_client(SUPABASE_URL, SUPABASE_SERVICE_ROLE_KEY)
 
     def get_client(self):
         return self.supabase
 
 
+class AsyncSupabaseClient:
+    """Supabase client for async handlers, backed by a pooled httpx client.
+
+    Queries are built exactly like with ``SupabaseClient`` but ``execute()``
+    has to be awaited, so a slow query no longer blocks the event loop.
+    The underlying client is built on the first ``get_client()``; call
+    ``aclose()`` on shutdown.
+    """
+
+    def __init__(self, max_connections=None, timeout=None, transport=None) -> None:
+        self.max_connections = max_connections or int(
+            os.getenv("SUPABASE_MAX_CONNECTIONS", "50")
+        )
+        self.timeout = timeout or float(os.getenv("SUPABASE_TIMEOUT", "30"))
+        # Custom httpx transport, e.g. an in-process fake for benchmarks
+        self.transport = transport
+        self.http_client = None
+        self.supabase = None
+
+    async def connect(self):
+        return self.get_client()
+
+    def get_client(self):
+        if self.supabase is not None:
+            return self.supabase
+        from supabase import AsyncClient, AsyncClientOptions
+
+        SUPABASE_URL = os.getenv("SUPABASE_URL")
+        SUPABASE_SERVICE_ROLE_KEY = os.getenv("SUPABASE_SERVICE_ROLE_KEY")
+        self.http_client = httpx.AsyncClient(
+            timeout=httpx.Timeout(self.timeout),
+            limits=httpx.Limits(
+                max_connections=self.max_connections,
+                max_keepalive_connections=self.max_connections,
+            ),
+            transport=self.transport,
+            event_hooks={
+                name: SUPABASE_EVENT_HOOKS[name] + SUPABASE_TRACE_HOOKS[name]
+                for name in ("request", "response")
+            },
+        )
+        # acreate_client() only adds a signed-in user's session on top of
+        # this, and the service role client never has one
+        self.supabase = AsyncClient(
+            SUPABASE_URL,
+            SUPABASE_SERVICE_ROLE_KEY,
+            options=AsyncClientOptions(httpx_client=self.http_client),
+        )
+        return self.supabase
+
+    async def aclose(self):
+        if self.http_client is not None:
+            await self.http_client.aclose()
+        self.http_client = None
+        self.supabase = None
+
+
 def test():
     message = [{"role": "user", "content": "Introduce yourself in one sentence."}]
     llm = LLM()
@@ -0,0 +1,167 @@
+"""iCalendar (RFC 5545) rendering of a user's tasks.
+
+Every task becomes one recurring VEVENT carrying the task's own RRULE, so a
+calendar client expands the occurrences itself and the ``events`` rows are
+never needed. Occurrences marked done are added as overrides of the
+recurring event (same UID, ``RECURRENCE-ID``) titled with a check mark.
+Output only depends on the rows passed in, so equal rows give byte-equal
+calendars and can share an ETag.
+
+Feeds are addressed by a random per-user token rather than the user id,
+since calendar clients can't send credentials; only its hash is stored.
+"""
+
+import hashlib
+import json
+import os
+import secrets
+from datetime import datetime, timezone
+
+ICAL_UID_DOMAIN = os.getenv("ICAL_UID_DOMAIN", "goalreacher.me")
+PRODID = "-//goalreacher//task_manager//EN"
+DONE_MARK = "✓ "
+# Bumped whenever the rendering changes, which invalidates every ETag
+FORMAT_VERSION = 2
+
+
+def escape_text(value):
+    return (
+        str(value)
+        .replace("\\", "\\\\")
+        .replace(";", "\\;")
+        .replace(",", "\\,")
+        .replace("\r\n", "\\n")
+        .replace("\n", "\\n")
+    )
+
+
+def fold(line):
+    """Split a content line into 75-octet pieces without cutting a UTF-8
+    sequence, joined by CRLF + space"""
+    data = line.encode()
+    if len(data) <= 75:
+        return line + "\r\n"
+    pieces = []
+    start, limit = 0, 75
+    while start < len(data):
+        end = min(start + limit, len(data))
+        # Continuation bytes look like 10xxxxxx
+        while end < len(data) and data[end] & 0xC0 == 0x80:
+            end -= 1
+        pieces.append(data[start:end].decode())
+        start, limit = end, 74
+    return "\r\n ".join(pieces) + "\r\n"
+
+
+def format_datetime(value):
+    """``YYYYMMDDTHHMMSSZ`` in UTC for an ISO timestamp (naive means UTC)"""
+    moment = datetime.fromisoformat(value)
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    return moment.astimezone(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+
+
+def recurrence_lines(recurrence):
+    """RRULE/EXDATE/RDATE lines of a task's ``recurrence`` column, which
+    holds them with or without the ``RRULE:`` prefix"""
+    lines = []
+    for line in (recurrence or "").splitlines():
+        line = line.strip()
+        if not line:
+            continue
+        name = line.partition(":")[0].upper()
+        if name not in ("RRULE", "EXDATE", "RDATE"):
+            line = f"RRULE:{line}"
+        lines.append(line)
+    return lines
+
+
+def new_feed_token():
+    """A secret for a user's feed URL, and the hash it is stored as"""
+    token = secrets.token_urlsafe(32)
+    return token, feed_token_hash(token)
+
+
+def feed_token_hash(token):
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+def task_uid(task):
+    return f"task-{task['id']}@{ICAL_UID_DOMAIN}"
+
+
+def calendar_etag(tasks, done_events):
+    """Strong ETag of the calendar ``iter_calendar`` renders from these rows"""
+    blob = json.dumps(
+        [FORMAT_VERSION, ICAL_UID_DOMAIN, tasks, done_events],
+        sort_keys=True,
+        default=str,
+    )
+    return f'"{hashlib.sha256(blob.encode()).hexdigest()[:32]}"'
+
+
+def _vevent(task, start, end, stamp, summary, extra):
+    return [
+        "BEGIN:VEVENT",
+        f"UID:{task_uid(task)}",
+        f"DTSTAMP:{stamp}",
+        *extra,
+        f"DTSTART:{format_datetime(start)}",
+        f"DTEND:{format_datetime(end)}",
+        f"SUMMARY:{escape_text(summary)}",
+    ]
+
+
+def iter_calendar(tasks, done_events, name="Goal Reacher"):
+    """Yield the VCALENDAR text a task at a time.
+
+    ``tasks`` are ``tasks`` rows and ``done_events`` the ``events`` rows
+    (``task_id``, ``start``, ``end``) of occurrences marked done.
+    """
+    done_by_task = {}
+    for event in done_events:
+        done_by_task.setdefault(event["task_id"], []).append(event)
+
+    yield "".join(
+        fold(line)
+        for line in (
+            "BEGIN:VCALENDAR",
+            "VERSION:2.0",
+            f"PRODID:{PRODID}",
+            "CALSCALE:GREGORIAN",
+            "METHOD:PUBLISH",
+            f"X-WR-CALNAME:{escape_text(name)}",
+        )
+    )
+    for task in tasks:
+        if not task.get("start_timestamptz") or not task.get("end_timestamptz"):
+            continue
+        # Deterministic, so that an unchanged task renders the same bytes
+        stamp = format_datetime(task.get("created_at") or task["start_timestamptz"])
+        # Counted from the events, since recurrence_time_done isn't kept up
+        # to date when occurrences are toggled
+        done = len(done_by_task.get(task["id"], []))
+        required = task.get("recurrence_time_required") or 0
+        lines = _vevent(
+            task,
+            task["start_timestamptz"],
+            task["end_timestamptz"],
+            stamp,
+            task.get("name", ""),
+            recurrence_lines(task.get("recurrence")),
+        )
+        lines += [f"DESCRIPTION:{done}/{required} done", "END:VEVENT"]
+        for event in sorted(
+            done_by_task.get(task["id"], []), key=lambda event: event["start"]
+        ):
+            lines += _vevent(
+                task,
+                event["start"],
+                event["end"],
+                stamp,
+                DONE_MARK + task.get("name", ""),
+                [f"RECURRENCE-ID:{format_datetime(event['start'])}"],
+            )
+            lines += ["CATEGORIES:DONE", "END:VEVENT"]
+        yield "".join(fold(line) for line in lines)
+    yield "END:VCALENDAR\r\n"
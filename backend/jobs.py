@@ -0,0 +1,141 @@
+import asyncio
+import json
+import sqlite3
+import time
+import uuid
+
+
+class JobQueue:
+    """In-process async job queue persisted to SQLite.
+
+    Jobs are rows in a local SQLite file, so anything still queued or
+    running when the process stops is picked up again by ``start()``.
+    A fixed pool of ``workers`` coroutines runs the handler registered
+    for each job's kind as ``await handler(payload, progress, resumed_from)``,
+    where ``progress(**fields)`` records how far the job has got and
+    ``resumed_from`` is the last progress recorded by an earlier run that
+    was interrupted (``None`` on a job's first run), so that handlers can
+    avoid repeating writes that already happened.
+    """
+
+    def __init__(
+        self, path="jobs.db", workers=2, retention=24 * 3600, grace=10.0
+    ) -> None:
+        self.workers = workers
+        self.retention = retention
+        self.grace = grace
+        self.handlers = {}
+        self._queue = asyncio.Queue()
+        self._tasks = []
+        self._running = set()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.row_factory = sqlite3.Row
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            "id TEXT PRIMARY KEY, kind TEXT NOT NULL, payload TEXT NOT NULL, "
+            "status TEXT NOT NULL, progress TEXT, result TEXT, error TEXT, "
+            "created_at REAL NOT NULL, updated_at REAL NOT NULL)"
+        )
+        self._db.commit()
+
+    def register(self, kind, handler):
+        self.handlers[kind] = handler
+
+    def submit(self, kind, payload):
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        self._db.execute(
+            "INSERT INTO jobs (id, kind, payload, status, created_at, updated_at) "
+            "VALUES (?, ?, ?, 'queued', ?, ?)",
+            (job_id, kind, json.dumps(payload), now, now),
+        )
+        self._db.commit()
+        self._queue.put_nowait(job_id)
+        return job_id
+
+    def get(self, job_id):
+        row = self._db.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is None:
+            return None
+        job = dict(row)
+        del job["payload"]
+        for field in ("progress", "result"):
+            job[field] = json.loads(job[field]) if job[field] else None
+        return job
+
+    def pending(self):
+        return self._queue.qsize()
+
+    def _update(self, job_id, **fields):
+        fields["updated_at"] = time.time()
+        columns = ", ".join(f"{column} = ?" for column in fields)
+        self._db.execute(
+            f"UPDATE jobs SET {columns} WHERE id = ?", (*fields.values(), job_id)
+        )
+        self._db.commit()
+
+    async def _run(self, job_id):
+        row = self._db.execute(
+            "SELECT kind, payload, status, progress FROM jobs WHERE id = ?",
+            (job_id,),
+        ).fetchone()
+        if row is None:
+            return
+        resumed_from = None
+        if row["status"] == "running" and row["progress"]:
+            resumed_from = json.loads(row["progress"])
+        self._update(job_id, status="running")
+
+        def progress(**fields):
+            self._update(job_id, progress=json.dumps(fields))
+
+        try:
+            handler = self.handlers[row["kind"]]
+            result = await handler(json.loads(row["payload"]), progress, resumed_from)
+            self._update(job_id, status="succeeded", result=json.dumps(result))
+        except Exception as e:
+            print(f"Job {job_id} ({row['kind']}) failed: {str(e)}")
+            self._update(job_id, status="failed", error=str(e))
+
+    async def _worker(self):
+        while True:
+            job_id = await self._queue.get()
+            task = asyncio.create_task(self._run(job_id))
+            # Forgotten when the job ends rather than when its worker does, so
+            # aclose() still sees the jobs of the workers it just cancelled
+            self._running.add(task)
+            task.add_done_callback(self._running.discard)
+            try:
+                # Shielded so shutdown can let a started job finish
+                await asyncio.shield(task)
+            finally:
+                self._queue.task_done()
+
+    def start(self):
+        self._db.execute(
+            "DELETE FROM jobs WHERE status IN ('succeeded', 'failed') "
+            "AND updated_at < ?",
+            (time.time() - self.retention,),
+        )
+        self._db.commit()
+        # Resume whatever was interrupted by the last shutdown
+        for row in self._db.execute(
+            "SELECT id FROM jobs WHERE status IN ('queued', 'running') "
+            "ORDER BY created_at"
+        ).fetchall():
+            self._queue.put_nowait(row["id"])
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def aclose(self):
+        # Stop taking jobs; queued ones stay in the database for the next start
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        if self._running:
+            # Jobs still unfinished after the grace period are resumed on restart
+            _, unfinished = await asyncio.wait(set(self._running), timeout=self.grace)
+            for task in unfinished:
+                task.cancel()
+            await asyncio.gather(*unfinished, return_exceptions=True)
+        self._db.close()
@@ -0,0 +1,96 @@
+"""Load test the backend against local stand-ins for Supabase and OpenAI.
+
+From the backend directory, start the stand-ins:
+
+    python -m loadtest serve --supabase-port 54321 --openai-port 54322
+
+start the backend against them:
+
+    SUPABASE_URL=http://127.0.0.1:54321 \\
+    SUPABASE_SERVICE_ROLE_KEY=eyJhbGciOiJIUzI1NiJ9.e30.local \\
+    OAUTH_PROFILE_URL=http://127.0.0.1:54321/api/profile \\
+    OPENAI_BASE_URL=http://127.0.0.1:54322/v1 OPENAI_API_KEY_CGI=local \\
+    uvicorn main:app --port 8000
+
+(add LLM_CACHE_SIZE=0 to measure every generate call against the fake model
+instead of the response cache, and ADMISSION_RATE=0 unless the per-user rate
+limit is what is being tested: virtual users replay sessions much faster than
+people do) and replay sessions at increasing concurrency:
+
+    python -m loadtest run --target http://127.0.0.1:8000 --levels 1,5,25,50
+
+Each level runs that many virtual users for ``--duration`` seconds and prints
+request count, errors, p50/p95/p99 latency and throughput per endpoint;
+``--json`` saves the same numbers keyed by concurrency level.
+FAKE_OPENAI_LATENCY and FAKE_OPENAI_TOKEN_DELAY tune the fake model.
+"""
+
+import argparse
+import asyncio
+import json
+import sys
+
+import uvicorn
+
+
+async def serve(host, supabase_port, openai_port):
+    from loadtest import fake_openai, fake_supabase
+
+    servers = [
+        uvicorn.Server(
+            uvicorn.Config(
+                fake_supabase.app, host=host, port=supabase_port, log_level="warning"
+            )
+        ),
+        uvicorn.Server(
+            uvicorn.Config(
+                fake_openai.app, host=host, port=openai_port, log_level="warning"
+            )
+        ),
+    ]
+    print(f"fake Supabase on http://{host}:{supabase_port}")
+    print(f"fake OpenAI on http://{host}:{openai_port}/v1")
+    await asyncio.gather(*[server.serve() for server in servers])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m loadtest")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    serve_parser = commands.add_parser("serve", help="run the stand-in services")
+    serve_parser.add_argument("--host", default="127.0.0.1")
+    serve_parser.add_argument("--supabase-port", type=int, default=54321)
+    serve_parser.add_argument("--openai-port", type=int, default=54322)
+
+    run_parser = commands.add_parser("run", help="run the load generator")
+    run_parser.add_argument("--target", default="http://127.0.0.1:8000")
+    run_parser.add_argument("--levels", default="1,5,10,25,50")
+    run_parser.add_argument("--duration", type=float, default=30.0)
+    run_parser.add_argument(
+        "--calendar-ratio",
+        type=float,
+        default=0.8,
+        help="share of sessions that use the calendar instead of onboarding",
+    )
+    run_parser.add_argument("--users", type=int, default=50)
+    run_parser.add_argument("--json", help="also write the report to this file")
+
+    args = parser.parse_args(argv)
+    if args.command == "serve":
+        asyncio.run(serve(args.host, args.supabase_port, args.openai_port))
+        return 0
+
+    from loadtest import loadgen
+
+    levels = [int(level) for level in args.levels.split(",")]
+    report = asyncio.run(
+        loadgen.run(args.target, levels, args.duration, args.calendar_ratio, args.users)
+    )
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,92 @@
+"""Stand-in for the OpenAI Responses API with configurable latency.
+
+``POST /v1/responses`` answers with canned text (or canned JSON for the
+MilestoneList/MissionList/ScheduleList formats) after a simulated delay:
+FAKE_OPENAI_LATENCY seconds before the first token plus FAKE_OPENAI_TOKEN_DELAY
+per ~4-character token. With ``"stream": true`` the text is sent as SSE
+``response.output_text.delta`` events paced the same way.
+
+Point the backend at it with ``OPENAI_BASE_URL=http://127.0.0.1:<port>/v1``.
+"""
+
+import asyncio
+import itertools
+import json
+import os
+
+from benchmarks.fakes import output_text, response_body
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+app = FastAPI()
+
+LATENCY = float(os.getenv("FAKE_OPENAI_LATENCY", "0.5"))
+TOKEN_DELAY = float(os.getenv("FAKE_OPENAI_TOKEN_DELAY", "0.005"))
+CHARS_PER_TOKEN = 4
+
+
+def stream_events(text, model):
+    sequence = itertools.count()
+
+    def event(kind, **data):
+        data.update(type=kind, sequence_number=next(sequence))
+        return f"event: {kind}\ndata: {json.dumps(data)}\n\n"
+
+    async def events():
+        yield event(
+            "response.created", response=response_body("", model, "in_progress")
+        )
+        yield event(
+            "response.output_item.added",
+            output_index=0,
+            item={
+                "type": "message",
+                "id": "msg_0",
+                "role": "assistant",
+                "status": "in_progress",
+                "content": [],
+            },
+        )
+        yield event(
+            "response.content_part.added",
+            item_id="msg_0",
+            output_index=0,
+            content_index=0,
+            part={"type": "output_text", "text": "", "annotations": []},
+        )
+        await asyncio.sleep(LATENCY)
+        for i in range(0, len(text), CHARS_PER_TOKEN):
+            await asyncio.sleep(TOKEN_DELAY)
+            yield event(
+                "response.output_text.delta",
+                item_id="msg_0",
+                output_index=0,
+                content_index=0,
+                delta=text[i : i + CHARS_PER_TOKEN],
+                logprobs=[],
+            )
+        yield event(
+            "response.output_text.done",
+            item_id="msg_0",
+            output_index=0,
+            content_index=0,
+            text=text,
+            logprobs=[],
+        )
+        yield event("response.completed", response=response_body(text, model))
+
+    return events()
+
+
+@app.post("/v1/responses")
+async def responses(request: Request):
+    body = await request.json()
+    text = output_text(body)
+    model = body.get("model", "gpt-4.1-nano")
+    if body.get("stream"):
+        return StreamingResponse(
+            stream_events(text, model), media_type="text/event-stream"
+        )
+    tokens = -(-len(text) // CHARS_PER_TOKEN)
+    await asyncio.sleep(LATENCY + tokens * TOKEN_DELAY)
+    return JSONResponse(response_body(text, model))
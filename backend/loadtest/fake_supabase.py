@@ -0,0 +1,242 @@
+"""In-memory PostgREST stand-in for load tests.
+
+Implements the subset of PostgREST that the backend uses: row filters (eq,
+neq, gt, gte, lt, lte, in, or), order, limit, ``count=exact``, single-object
+responses, ``!inner`` embeds used as filters, inserts/updates/deletes with
+``return=representation`` and the ``save_plan`` RPC. It also answers the
+identity provider's ``/api/profile`` so ``verify_token`` can be exercised:
+a bearer token ``user-<name>`` belongs to user ``<name>``.
+
+Point the backend at it with ``SUPABASE_URL=http://127.0.0.1:<port>`` and
+``OAUTH_PROFILE_URL=http://127.0.0.1:<port>/api/profile``.
+"""
+
+import itertools
+import json
+import re
+from collections import defaultdict
+from datetime import datetime, timezone
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, Response
+
+app = FastAPI()
+
+TIMESTAMP_COLUMNS = {"start", "end", "start_timestamptz", "end_timestamptz"}
+tables = defaultdict(list)
+ids = defaultdict(lambda: itertools.count(1))
+
+
+def reset():
+    tables.clear()
+    ids.clear()
+
+
+def normalize(column, value):
+    # Stored like Postgres returns timestamptz, so string order is time order
+    if column in TIMESTAMP_COLUMNS and isinstance(value, str) and value:
+        parsed = datetime.fromisoformat(value.replace("Z", "+00:00"))
+        if parsed.tzinfo is None:
+            parsed = parsed.replace(tzinfo=timezone.utc)
+        return parsed.astimezone(timezone.utc).isoformat()
+    return value
+
+
+def parse_value(column, raw):
+    raw = raw.strip()
+    if raw.startswith('"') and raw.endswith('"'):
+        raw = raw[1:-1]
+    if raw in ("true", "false"):
+        return raw == "true"
+    if raw == "null":
+        return None
+    if re.fullmatch(r"-?\d+", raw):
+        return int(raw)
+    return normalize(column, raw)
+
+
+def split_top_level(text):
+    parts, depth, quoted, current = [], 0, False, ""
+    for char in text:
+        if char == '"':
+            quoted = not quoted
+        elif not quoted and char == "(":
+            depth += 1
+        elif not quoted and char == ")":
+            depth -= 1
+        elif not quoted and char == "," and depth == 0:
+            parts.append(current)
+            current = ""
+            continue
+        current += char
+    if current:
+        parts.append(current)
+    return parts
+
+
+def compile_filter(column, expression):
+    """Predicate over a row for ``column=op.value`` (or a nested or/and)"""
+    if column in ("or", "and"):
+        inner = [compile_condition(part) for part in split_top_level(expression[1:-1])]
+        combine = any if column == "or" else all
+        return lambda row: combine(predicate(row) for predicate in inner)
+
+    op, _, raw = expression.partition(".")
+    if op == "in":
+        values = {parse_value(column, v) for v in split_top_level(raw[1:-1])}
+        return lambda row: row.get(column) in values
+    value = parse_value(column, raw)
+    compare = {
+        "eq": lambda a: a == value,
+        "neq": lambda a: a != value,
+        "gt": lambda a: a is not None and a > value,
+        "gte": lambda a: a is not None and a >= value,
+        "lt": lambda a: a is not None and a < value,
+        "lte": lambda a: a is not None and a <= value,
+    }[op]
+    return lambda row: compare(row.get(column))
+
+
+def compile_condition(condition):
+    # "start.gt.x" or "and(start.eq.x,id.gt.1)"
+    if condition.startswith(("and(", "or(")):
+        name, _, rest = condition.partition("(")
+        return compile_filter(name, "(" + rest)
+    column, _, expression = condition.partition(".")
+    return compile_filter(column, expression)
+
+
+def query_rows(table, params):
+    rows = tables[table]
+    embeds = re.findall(r"(\w+)!inner\(\)", params.get("select", ""))
+    for name, value in params.multi_items():
+        if name in ("select", "order", "limit", "offset", "columns"):
+            continue
+        if "." in name and name.split(".")[0] in embeds:
+            # Filter through an inner embed: events.task_id -> tasks.id
+            embed, column = name.split(".", 1)
+            foreign_key = f"{embed[:-1]}_id"
+            predicate = compile_filter(column, value)
+            matching = {row["id"] for row in tables[embed] if predicate(row)}
+            rows = [row for row in rows if row.get(foreign_key) in matching]
+        else:
+            predicate = compile_filter(name, value)
+            rows = [row for row in rows if predicate(row)]
+    return rows
+
+
+def shape(rows, params):
+    select = params.get("select", "*")
+    columns = [
+        column.strip().strip('"')
+        for column in select.split(",")
+        if column.strip() and "(" not in column
+    ]
+    for order in reversed(params.get("order", "").split(",")):
+        if order:
+            column, _, direction = order.partition(".")
+            rows = sorted(
+                rows,
+                key=lambda row: (row.get(column) is None, row.get(column)),
+                reverse=direction.startswith("desc"),
+            )
+    total = len(rows)
+    offset = int(params.get("offset", 0))
+    rows = rows[offset:]
+    if "limit" in params:
+        rows = rows[: int(params["limit"])]
+    if columns and columns != ["*"]:
+        rows = [{column: row.get(column) for column in columns} for row in rows]
+    else:
+        rows = [dict(row) for row in rows]
+    return rows, total
+
+
+def respond(request, rows, status=200, total=None):
+    headers = {}
+    if "count=exact" in request.headers.get("prefer", ""):
+        end = max(len(rows) - 1, 0)
+        headers["Content-Range"] = (
+            f"0-{end}/{total if total is not None else len(rows)}"
+        )
+    if "vnd.pgrst.object" in request.headers.get("accept", ""):
+        if len(rows) != 1:
+            return JSONResponse(
+                {
+                    "code": "PGRST116",
+                    "message": "JSON object requested, multiple (or no) rows returned",
+                    "details": f"The result contains {len(rows)} rows",
+                    "hint": None,
+                },
+                status_code=406,
+            )
+        return JSONResponse(rows[0], status_code=status, headers=headers)
+    if "return=minimal" in request.headers.get("prefer", ""):
+        return Response(status_code=204 if status == 200 else status, headers=headers)
+    return JSONResponse(rows, status_code=status, headers=headers)
+
+
+def insert(table, body):
+    rows = body if isinstance(body, list) else [body]
+    inserted = []
+    for row in rows:
+        row = {column: normalize(column, value) for column, value in row.items()}
+        row.setdefault("id", next(ids[table]))
+        if table == "events":
+            row.setdefault("isDone", False)
+        tables[table].append(row)
+        inserted.append(row)
+    return inserted
+
+
+@app.get("/api/profile")
+async def profile(request: Request):
+    token = request.headers.get("authorization", "").removeprefix("Bearer ")
+    if not token.startswith("user-"):
+        return JSONResponse({"error": "invalid token"}, status_code=401)
+    username = token.removeprefix("user-")
+    return {"username": username, "email": f"{username}@example.com"}
+
+
+@app.post("/rest/v1/rpc/save_plan")
+async def save_plan(request: Request):
+    args = await request.json()
+    user_id = args["p_user_id"]
+    if args["p_replace"]:
+        for table in ("milestones", "tasks"):
+            tables[table] = [r for r in tables[table] if r.get("user_id") != user_id]
+    for row in tables["users"]:
+        if row["user_id"] == user_id:
+            row.update(goal=args["p_goal"], status="working")
+    insert("milestones", [dict(m, user_id=user_id) for m in args["p_milestones"]])
+    tasks = insert("tasks", [dict(t, user_id=user_id) for t in args["p_tasks"]])
+    return respond(request, [dict(task) for task in tasks])
+
+
+@app.get("/rest/v1/{table}")
+async def select(table: str, request: Request):
+    rows, total = shape(query_rows(table, request.query_params), request.query_params)
+    return respond(request, rows, total=total)
+
+
+@app.post("/rest/v1/{table}")
+async def create(table: str, request: Request):
+    rows = insert(table, json.loads(await request.body()))
+    return respond(request, [dict(row) for row in rows], status=201)
+
+
+@app.patch("/rest/v1/{table}")
+async def update(table: str, request: Request):
+    changes = await request.json()
+    rows = query_rows(table, request.query_params)
+    for row in rows:
+        row.update({column: normalize(column, v) for column, v in changes.items()})
+    return respond(request, [dict(row) for row in rows])
+
+
+@app.delete("/rest/v1/{table}")
+async def delete(table: str, request: Request):
+    doomed = query_rows(table, request.query_params)
+    doomed_ids = {id(row) for row in doomed}
+    tables[table] = [row for row in tables[table] if id(row) not in doomed_ids]
+    return respond(request, [dict(row) for row in doomed])
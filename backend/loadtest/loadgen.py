@@ -0,0 +1,238 @@
+"""Replay onboarding and calendar sessions against the backend under
+increasing concurrency and report latency percentiles per endpoint."""
+
+import asyncio
+import itertools
+import random
+import time
+from collections import defaultdict
+
+import httpx
+
+PLAN_GOAL = "I want to read more books"
+USER_DESCRIPTION = "I read about one book a year"
+
+
+class Recorder:
+    def __init__(self) -> None:
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+
+    async def call(self, client, name, method, url, **kwargs):
+        begin = time.perf_counter()
+        try:
+            response = await client.request(method, url, **kwargs)
+        except httpx.HTTPError:
+            self.errors[name] += 1
+            return None
+        self.latencies[name].append(time.perf_counter() - begin)
+        if response.status_code >= 400:
+            self.errors[name] += 1
+            return None
+        return response.json()
+
+
+async def onboarding_session(client, recorder, user):
+    """The five generate calls the onboarding pages make, then saving"""
+    # The Next.js proxies forward the access_token cookie as a bearer token,
+    # which admission control tells users apart by once it has been verified
+    headers = {"Authorization": f"Bearer user-{user}"}
+    # A fresh goal per session so the response cache doesn't answer everything
+    goal = await recorder.call(
+        client,
+        "generate-goal",
+        "POST",
+        "/api/generate-goal",
+        json={"goal": f"{PLAN_GOAL} ({user}, {random.getrandbits(32):08x})"},
+        headers=headers,
+    )
+    if goal is None:
+        return
+    status = await recorder.call(
+        client,
+        "generate-status",
+        "POST",
+        "/api/generate-status",
+        json={"goal": goal["goal"], "user_description": USER_DESCRIPTION},
+        headers=headers,
+    )
+    if status is None:
+        return
+    base = {"goal": goal["goal"], "status": status["status"]}
+    milestones = await recorder.call(
+        client,
+        "generate-milestones",
+        "POST",
+        "/api/generate-milestones",
+        json=base,
+        headers=headers,
+    )
+    if milestones is None:
+        return
+    missions = await recorder.call(
+        client,
+        "generate-missions",
+        "POST",
+        "/api/generate-missions",
+        json={**base, "milestones": milestones},
+        headers=headers,
+    )
+    if missions is None:
+        return
+    schedules = await recorder.call(
+        client,
+        "generate-schedules",
+        "POST",
+        "/api/generate-schedules",
+        json={"missions": missions["missions"]},
+        headers=headers,
+    )
+    if schedules is None:
+        return
+    saved = await recorder.call(
+        client,
+        "save-data",
+        "POST",
+        "/api/save-data",
+        json={
+            **base,
+            "milestones": milestones,
+            "missions": missions,
+            "schedules": schedules,
+            "userid": user,
+        },
+    )
+    while saved and saved.get("status_url"):
+        job = await recorder.call(client, "jobs", "GET", saved["status_url"])
+        if job is None or job["status"] in ("succeeded", "failed"):
+            break
+        await asyncio.sleep(0.2)
+
+
+async def calendar_session(client, recorder, user):
+    """Open the calendar, look at the profile and tick off a few events"""
+    headers = {"Authorization": f"Bearer user-{user}"}
+    await recorder.call(client, "profile", "GET", "/profile", headers=headers)
+    loaded = await recorder.call(
+        client,
+        "load-data",
+        "POST",
+        "/api/load-data",
+        json={
+            "user_id": user,
+            "start": "2026-01-01T00:00:00+00:00",
+            "end": "2030-01-01T00:00:00+00:00",
+            "limit": 200,
+        },
+    )
+    events = (loaded or {}).get("events", {}).get("data", [])
+    if not events:
+        return
+    for event in random.sample(events, min(3, len(events))):
+        await recorder.call(
+            client,
+            "events-toggle",
+            "POST",
+            "/api/events/toggle",
+            json={
+                "event_id": event["id"],
+                "is_done": not event["isDone"],
+                "user_id": user,
+            },
+        )
+    await recorder.call(
+        client,
+        "events-toggle-batch",
+        "POST",
+        "/api/events/toggle-batch",
+        json={
+            "user_id": user,
+            "events": [
+                {"event_id": event["id"], "is_done": True} for event in events[:7]
+            ],
+        },
+    )
+
+
+async def virtual_user(client, recorder, user, deadline, calendar_ratio):
+    while time.perf_counter() < deadline:
+        if random.random() < calendar_ratio:
+            await calendar_session(client, recorder, user)
+        else:
+            await onboarding_session(client, recorder, user)
+
+
+async def run_stage(base_url, concurrency, duration, calendar_ratio, users):
+    recorder = Recorder()
+    limits = httpx.Limits(
+        max_connections=concurrency, max_keepalive_connections=concurrency
+    )
+    async with httpx.AsyncClient(
+        base_url=base_url, timeout=120, limits=limits
+    ) as client:
+        begin = time.perf_counter()
+        deadline = begin + duration
+        await asyncio.gather(
+            *[
+                virtual_user(client, recorder, user, deadline, calendar_ratio)
+                for user, _ in zip(itertools.cycle(users), range(concurrency))
+            ]
+        )
+        elapsed = time.perf_counter() - begin
+    return recorder, elapsed
+
+
+async def create_users(base_url, users):
+    async with httpx.AsyncClient(base_url=base_url, timeout=30) as client:
+        for user in users:
+            await client.post(
+                "/create-user", json={"user_id": user, "email": f"{user}@example.com"}
+            )
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    index = min(int(round(fraction * (len(ordered) - 1))), len(ordered) - 1)
+    return ordered[index]
+
+
+def summarize(recorder, elapsed):
+    rows = {}
+    for name in sorted(set(recorder.latencies) | set(recorder.errors)):
+        latencies = recorder.latencies[name] or [float("nan")]
+        rows[name] = {
+            "requests": len(recorder.latencies[name]),
+            "errors": recorder.errors[name],
+            "p50": percentile(latencies, 0.50),
+            "p95": percentile(latencies, 0.95),
+            "p99": percentile(latencies, 0.99),
+            "throughput": len(recorder.latencies[name]) / elapsed,
+        }
+    return rows
+
+
+def print_stage(concurrency, rows):
+    print(f"\nconcurrency {concurrency}")
+    print(
+        f"{'endpoint':<22}{'requests':>9}{'errors':>8}"
+        f"{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'req/s':>9}"
+    )
+    for name, row in rows.items():
+        print(
+            f"{name:<22}{row['requests']:>9}{row['errors']:>8}"
+            f"{row['p50'] * 1000:>10.1f}{row['p95'] * 1000:>10.1f}"
+            f"{row['p99'] * 1000:>10.1f}{row['throughput']:>9.1f}"
+        )
+
+
+async def run(base_url, levels, duration, calendar_ratio, user_count):
+    users = [f"loadtest{i}" for i in range(user_count)]
+    await create_users(base_url, users)
+    report = {}
+    for concurrency in levels:
+        recorder, elapsed = await run_stage(
+            base_url, concurrency, duration, calendar_ratio, users
+        )
+        report[concurrency] = summarize(recorder, elapsed)
+        print_stage(concurrency, report[concurrency])
+    return report
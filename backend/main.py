@@ -1,18 +1,151 @@
+import asyncio
+import base64
+import hashlib
+import importlib
+import json
 import os
-from datetime import datetime
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta, timezone
 from typing import Optional
 
+import admission
 import httpx
-from chat import gen_goal, gen_milestones, gen_missions, gen_schedules, gen_status
-from client import SupabaseClient
+from admission import AdmissionMiddleware
+from cache import MISSING, PlanCache, SingleFlight, TTLCache
+from chat import (
+    AsyncChatClient,
+    Milestone,
+    MilestoneList,
+    Mission,
+    MissionList,
+    ResponseCacheStore,
+    Schedule,
+    ScheduleList,
+    agen_goal,
+    agen_milestones,
+    agen_missions,
+    agen_plan,
+    agen_schedules,
+    agen_schedules_local,
+    agen_status,
+    astream_goal,
+    astream_milestones,
+    astream_missions,
+    astream_schedules,
+    astream_schedules_local,
+    astream_status,
+    today_utc,
+)
+from client import AsyncSupabaseClient
 from fastapi import Depends, FastAPI, Header, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 from httpx import RequestError
+from ical import calendar_etag, feed_token_hash, iter_calendar, new_feed_token
+from jobs import JobQueue
+from metrics import MetricsMiddleware, render_metrics
 from pydantic import BaseModel
-from util import task2events
+from speculation import SPECULATION, Speculator
+from streaming import sse_event, sse_items, sse_text
+from tracing import TracingMiddleware, current_trace, traced
+from util import (
+    EVENT_HORIZON_DAYS,
+    extend_events,
+    horizon_end,
+    milestone_rows,
+    task2events,
+    task_rows,
+)
+from writebehind import WriteBehindBuffer
+
+OAUTH_PROFILE_URL = os.getenv("OAUTH_PROFILE_URL", "https://id.nycu.edu.tw/api/profile")
+TOKEN_CACHE_TTL = float(os.getenv("TOKEN_CACHE_TTL", "300"))
+TOKEN_CACHE_NEGATIVE_TTL = float(os.getenv("TOKEN_CACHE_NEGATIVE_TTL", "30"))
+TOKEN_CACHE_SIZE = int(os.getenv("TOKEN_CACHE_SIZE", "4096"))
+LOAD_DATA_MAX_LIMIT = int(os.getenv("LOAD_DATA_MAX_LIMIT", "2000"))
+# Bounded request size and parallelism for bulk inserts
+INSERT_CHUNK_SIZE = int(os.getenv("INSERT_CHUNK_SIZE", "500"))
+INSERT_CONCURRENCY = int(os.getenv("INSERT_CONCURRENCY", "4"))
+# Save plans through the save_plan Postgres function (sql/save_plan.sql)
+save_plan_rpc = os.getenv("SAVE_PLAN_RPC", "1") == "1"
+# Whether events have the (task_id, start) unique constraint from
+# sql/events_unique.sql; turned off when it turns out to be missing
+events_unique = os.getenv("EVENTS_UNIQUE", "1") == "1"
+# Run /api/save-data as a background job and answer 202 right away. Off by
+# default: the web app treats any 2xx as saved and doesn't poll the job
+SAVE_DATA_BACKGROUND = os.getenv("SAVE_DATA_BACKGROUND", "0") == "1"
+JOB_QUEUE_PATH = os.getenv("JOB_QUEUE_PATH", "jobs.db")
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+# Acknowledge isDone toggles from memory and write them to Supabase in bulk
+TOGGLE_WRITE_BEHIND = os.getenv("TOGGLE_WRITE_BEHIND", "0") == "1"
+TOGGLE_FLUSH_INTERVAL = float(os.getenv("TOGGLE_FLUSH_INTERVAL", "1.0"))
+TOGGLE_FLUSH_SIZE = int(os.getenv("TOGGLE_FLUSH_SIZE", "500"))
+EVENT_COLUMNS = "id, task_id, title, start, end, isDone"
+# How long load_data trusts a user's event window to be extended far enough
+EVENT_EXTEND_INTERVAL = float(os.getenv("EVENT_EXTEND_INTERVAL", "3600"))
+# How /api/generate-schedules schedules missions unless ?mode= says otherwise:
+# "llm" asks the model for the whole schedule, "local" uses scheduler.py and
+# "hybrid" uses scheduler.py with model-written event titles
+SCHEDULER_MODE = os.getenv("SCHEDULER_MODE", "llm")
+SCHEDULER_MODES = ("llm", "local", "hybrid")
+# Import the SDKs and build the clients in the background once the app is
+# serving, instead of on the first request that needs them
+WARM_UP = os.getenv("WARM_UP", "1") == "1"
+WARM_UP_MODULES = (
+    "openai",
+    "supabase",
+    "postgrest.exceptions",
+    "numpy",
+    "dateutil.rrule",
+)
+
+
+async def warm_up():
+    for module in WARM_UP_MODULES:
+        # In a thread, so requests keep being served in between
+        await asyncio.to_thread(importlib.import_module, module)
+    supabase_client.get_client()
+    AsyncChatClient.client
 
-app = FastAPI()
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # One pooled client for the OAuth provider, so token checks reuse
+    # keep-alive connections instead of doing a TLS handshake per request
+    app.state.http_client = httpx.AsyncClient(
+        timeout=httpx.Timeout(10.0),
+        limits=httpx.Limits(max_connections=100, max_keepalive_connections=20),
+    )
+    warm_up_task = asyncio.create_task(warm_up()) if WARM_UP else None
+    if toggle_buffer is not None:
+        toggle_buffer.start()
+    app.state.job_queue = JobQueue(JOB_QUEUE_PATH, workers=JOB_WORKERS)
+    app.state.job_queue.register("save_plan", run_save_plan_job)
+    app.state.job_queue.start()
+    try:
+        yield
+    finally:
+        if warm_up_task is not None:
+            warm_up_task.cancel()
+        # Let running jobs finish while the clients they use are still open
+        await app.state.job_queue.aclose()
+        if toggle_buffer is not None:
+            # Final flush while the Supabase client is still open
+            await toggle_buffer.aclose()
+        await app.state.http_client.aclose()
+        await supabase_client.aclose()
+        await plan_cache.aclose()
+        await speculator.aclose()
+        await AsyncChatClient.aclose()
+        ResponseCacheStore.close()
+
+
+app = FastAPI(lifespan=lifespan)
+
+# Inside CORS, so that 429s carry the CORS headers too
+app.add_middleware(
+    AdmissionMiddleware, identify=lambda token_hash: verified_user_id(token_hash)
+)
 # Add CORS middleware
 app.add_middleware(
     CORSMiddleware,
@@ -25,9 +158,56 @@ app.add_middleware(
     allow_credentials=True,  # Important for cookies
     allow_methods=["GET", "POST", "PUT", "DELETE"],
     allow_headers=["*"],
+    expose_headers=["Retry-After"],
+)
+app.add_middleware(MetricsMiddleware)
+app.add_middleware(TracingMiddleware)
+
+supabase_client = AsyncSupabaseClient()
+
+# token sha256 -> TokenData, or None for tokens the provider rejected
+token_cache = TTLCache(maxsize=TOKEN_CACHE_SIZE, ttl=TOKEN_CACHE_TTL)
+token_flight = SingleFlight()
+
+
+def verified_user_id(token_hash):
+    """The user a token was last verified to belong to, if it still is cached"""
+    token_data = token_cache.get(token_hash, None)
+    return token_data.user_id if token_data is not None else None
+
+
+# Per-user cache of rows read from Supabase, invalidated by every write path
+plan_cache = PlanCache.from_env()
+
+# Next onboarding stages generated ahead of the request, when enabled
+speculator = Speculator()
+
+
+def should_speculate():
+    # Speculations would take slots from requests already waiting for one
+    return SPECULATION and admission.limiter.queued == 0
+
+
+# event_id -> (is_done, user_id) waiting to be written, when write-behind is enabled
+toggle_buffer = (
+    WriteBehindBuffer(
+        lambda toggles: flush_event_toggles(toggles),
+        interval=TOGGLE_FLUSH_INTERVAL,
+        max_size=TOGGLE_FLUSH_SIZE,
+    )
+    if TOGGLE_WRITE_BEHIND
+    else None
 )
+# user_id -> datetime the user's events were last extended up to
+events_extended = TTLCache(maxsize=16384, ttl=EVENT_EXTEND_INTERVAL)
+extend_flight = SingleFlight()
 
-supabase_client = SupabaseClient()
+# (user_id, event_id) pairs already known to be owned, so buffered toggles
+# don't need a database round trip on every flip
+event_owner_cache = TTLCache(maxsize=16384, ttl=600)
+# Calendar feed token hash -> user_id (None for unknown tokens). Short, since
+# a rotated token keeps working in other processes until it expires here
+calendar_feed_cache = TTLCache(maxsize=16384, ttl=60)
 
 
 class User(BaseModel):
@@ -82,6 +262,35 @@ class SaveDataRequest(BaseModel):
     userid: str
 
 
+class PlanRequest(BaseModel):
+    goal: str
+    previous_status: Optional[str] = "None"
+    user_description: Optional[str] = "None"
+    today: Optional[str] = None
+    # When set, the finished plan is saved for this user like /api/save-data
+    userid: Optional[str] = None
+
+
+class EventToggle(BaseModel):
+    event_id: int
+    is_done: bool
+
+
+class ToggleEventsBatchRequest(BaseModel):
+    user_id: str
+    events: list[EventToggle]
+
+
+class LoadDataRequest(BaseModel):
+    user_id: str
+    email: Optional[str] = None
+    # ISO timestamps; events with start in [start, end) are returned
+    start: Optional[str] = None
+    end: Optional[str] = None
+    cursor: Optional[str] = None
+    limit: Optional[int] = None
+
+
 class UpdateTaskProgressRequest(BaseModel):
     task_id: int
     recurrence_done: int
@@ -112,25 +321,54 @@ async def verify_token(
             detail="Missing token. Provide either Authorization header or access_token cookie",
         )
 
-    try:
-        # Verify token with NYCU OAuth provider
-        async with httpx.AsyncClient() as client:
-            response = await client.get(
-                "https://id.nycu.edu.tw/api/profile",
-                headers={"Authorization": f"Bearer {token}"},
+    token_hash = hashlib.sha256(token.encode()).hexdigest()
+    token_data = token_cache.get(token_hash)
+    if token_data is MISSING:
+        try:
+            token_data = await token_flight.do(
+                token_hash,
+                lambda: fetch_token_data(
+                    request.app.state.http_client, token, token_hash
+                ),
+            )
+        except RequestError as e:
+            raise HTTPException(
+                status_code=401, detail=f"Token verification failed: {str(e)}"
+            )
+        except httpx.HTTPStatusError as e:
+            raise HTTPException(
+                status_code=503,
+                detail=f"Token verification unavailable: {str(e)}",
             )
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Unexpected error: {str(e)}")
 
-        if response.status_code != 200:
-            raise HTTPException(status_code=401, detail="Invalid or expired token")
+    if token_data is None:
+        raise HTTPException(status_code=401, detail="Invalid or expired token")
+    return token_data
 
-        user_data = response.json()
-        return TokenData(user_id=user_data["username"], email=user_data["email"])
-    except RequestError as e:
-        raise HTTPException(
-            status_code=401, detail=f"Token verification failed: {str(e)}"
-        )
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Unexpected error: {str(e)}")
+
+async def fetch_token_data(
+    client: httpx.AsyncClient, token: str, token_hash: str
+) -> Optional[TokenData]:
+    """Verify token with NYCU OAuth provider and cache the outcome"""
+    response = await client.get(
+        OAUTH_PROFILE_URL,
+        headers={"Authorization": f"Bearer {token}"},
+    )
+
+    if response.status_code in (401, 403):
+        # Negative cache rejected tokens for a shorter time
+        token_cache.set(token_hash, None, ttl=TOKEN_CACHE_NEGATIVE_TTL)
+        return None
+    # Rate limits and provider errors say nothing about the token, so they
+    # fail this request without being cached
+    response.raise_for_status()
+
+    user_data = response.json()
+    token_data = TokenData(user_id=user_data["username"], email=user_data["email"])
+    token_cache.set(token_hash, token_data)
+    return token_data
 
 
 @app.get("/")
@@ -143,7 +381,7 @@ async def create_user(user: User):
     """Create user without storing OAuth tokens"""
     try:
         # Check if user already exists
-        existing_user = (
+        existing_user = await (
             supabase_client.get_client()
             .from_("users")
             .select("*")
@@ -159,7 +397,7 @@ async def create_user(user: User):
             }
 
         # Insert user without storing OAuth token
-        result = (
+        result = await (
             supabase_client.get_client()
             .from_("users")
             .insert(
@@ -188,6 +426,7 @@ async def create_user(user: User):
                 status_code=500, detail="Failed to create user: No data returned"
             )
 
+        await plan_cache.invalidate(user.user_id)
         print(f"User created successfully: {user.user_id}")
         return {
             "message": "User created successfully",
@@ -210,24 +449,34 @@ async def create_user(user: User):
 async def get_profile(token_data: TokenData = Depends(verify_token)):
     """Protected route that requires valid OAuth token"""
     # Get user data from database
-    user_result = (
-        supabase_client.get_client()
-        .from_("users")
-        .select("*")
-        .eq("user_id", token_data.user_id)
-        .execute()
-    )
+    user_rows = await load_user_rows(token_data.user_id)
 
-    if not user_result.data:
+    if not user_rows:
         raise HTTPException(status_code=404, detail="User not found")
 
     return {
         "user_id": token_data.user_id,
         "email": token_data.email,
-        "profile": user_result.data[0],
+        "profile": user_rows[0],
     }
 
 
+async def load_user_rows(user_id):
+    """The user's row from the users table, through the plan cache"""
+
+    async def load():
+        user_result = await (
+            supabase_client.get_client()
+            .from_("users")
+            .select("*")
+            .eq("user_id", user_id)
+            .execute()
+        )
+        return user_result.data
+
+    return await plan_cache.get_or_load(user_id, "user", load)
+
+
 @app.post("/logout")
 async def logout(request: Request):
     """Logout endpoint that clears the access token cookie"""
@@ -263,19 +512,74 @@ async def logout(request: Request):
     return response
 
 
+@app.get("/metrics")
+async def metrics():
+    """Prometheus metrics of this process"""
+    body, content_type = render_metrics()
+    return Response(body, media_type=content_type)
+
+
+@app.get("/api/llm-cache")
+async def llm_cache_stats():
+    """Hit/miss counters of the LLM response cache"""
+    return ResponseCacheStore.stats()
+
+
+@app.get("/api/speculation")
+async def speculation_stats():
+    """Hit ratio and wasted tokens of speculative pre-generation"""
+    return speculator.stats()
+
+
+@app.get("/api/admission")
+async def admission_stats():
+    """Concurrency slots in use and requests waiting for one"""
+    return admission.limiter.stats()
+
+
+def event_stream(events):
+    return StreamingResponse(
+        events,
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@app.get("/api/plan-cache")
+async def plan_cache_stats():
+    """Hit ratio and evictions of the per-user plan cache"""
+    return plan_cache.stats()
+
+
+async def astream_speculated(result):
+    """A speculative result for the streaming endpoints, as one JSON chunk"""
+    yield result.model_dump_json()
+
+
 @app.post("/api/generate-goal")
-async def generate_goal(request: GoalRequest):
+async def generate_goal(request: GoalRequest, stream: bool = False):
+    if stream:
+        return event_stream(sse_text(astream_goal(request.goal), "goal"))
     try:
-        result = gen_goal(request.goal)
+        result = await agen_goal(request.goal)
         return {"goal": result}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error generating goal: {str(e)}")
 
 
 @app.post("/api/generate-status")
-async def generate_status(request: StatusRequest):
+async def generate_status(request: StatusRequest, stream: bool = False):
+    if stream:
+        return event_stream(
+            sse_text(
+                astream_status(
+                    request.goal, request.previous_status, request.user_description
+                ),
+                "status",
+            )
+        )
     try:
-        result = gen_status(
+        result = await agen_status(
             request.goal, request.previous_status, request.user_description
         )
         return {"status": result}
@@ -286,9 +590,25 @@ async def generate_status(request: StatusRequest):
 
 
 @app.post("/api/generate-milestones")
-async def generate_milestones(request: MilestoneRequest):
+async def generate_milestones(request: MilestoneRequest, stream: bool = False):
+    if stream:
+        return event_stream(
+            sse_items(
+                astream_milestones(request.goal, request.status),
+                MilestoneList,
+                Milestone,
+                "milestones",
+            )
+        )
     try:
-        result = gen_milestones(request.goal, request.status)
+        result = await agen_milestones(request.goal, request.status)
+        if should_speculate():
+            # Missions for these milestones, in case the user keeps them
+            speculator.start(
+                "missions",
+                (request.goal, request.status, result.model_dump()),
+                agen_missions,
+            )
         # Convert the Pydantic model to dict
         return result.dict() if hasattr(result, "dict") else result
     except Exception as e:
@@ -298,9 +618,38 @@ async def generate_milestones(request: MilestoneRequest):
 
 
 @app.post("/api/generate-missions")
-async def generate_missions(request: MissionRequest):
+async def generate_missions(request: MissionRequest, stream: bool = False):
+    speculated = MISSING
+    if SPECULATION:
+        speculated = await speculator.claim(
+            "missions", (request.goal, request.status, request.milestones)
+        )
+    if stream:
+        return event_stream(
+            sse_items(
+                (
+                    astream_missions(request.goal, request.status, request.milestones)
+                    if speculated is MISSING
+                    else astream_speculated(speculated)
+                ),
+                MissionList,
+                Mission,
+                "missions",
+            )
+        )
     try:
-        result = gen_missions(request.goal, request.status, request.milestones)
+        result = speculated
+        if result is MISSING:
+            result = await agen_missions(
+                request.goal, request.status, request.milestones
+            )
+        if should_speculate() and SCHEDULER_MODE == "llm":
+            # Schedules for these missions, in case the user keeps them
+            speculator.start(
+                "schedules",
+                (result.model_dump()["missions"], today_utc()),
+                agen_schedules,
+            )
         # Convert the Pydantic model to dict
         return result.dict() if hasattr(result, "dict") else result
     except Exception as e:
@@ -310,10 +659,54 @@ async def generate_missions(request: MissionRequest):
 
 
 @app.post("/api/generate-schedules")
-async def generate_schedules(request: ScheduleRequest):
+async def generate_schedules(
+    request: ScheduleRequest, stream: bool = False, mode: Optional[str] = None
+):
+    today = request.today or today_utc()
+    mode = mode or SCHEDULER_MODE
+    if mode not in SCHEDULER_MODES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unknown scheduling mode {mode!r}, use one of {SCHEDULER_MODES}",
+        )
+    if mode != "llm":
+        summaries = mode == "hybrid"
+        if stream:
+            return event_stream(
+                sse_items(
+                    astream_schedules_local(request.missions, today, summaries),
+                    ScheduleList,
+                    Schedule,
+                    "schedules",
+                )
+            )
+        try:
+            result = await agen_schedules_local(request.missions, today, summaries)
+            return result.model_dump()
+        except Exception as e:
+            raise HTTPException(
+                status_code=500, detail=f"Error generating schedules: {str(e)}"
+            )
+    speculated = MISSING
+    if SPECULATION:
+        speculated = await speculator.claim("schedules", (request.missions, today))
+    if stream:
+        return event_stream(
+            sse_items(
+                (
+                    astream_schedules(request.missions, today)
+                    if speculated is MISSING
+                    else astream_speculated(speculated)
+                ),
+                ScheduleList,
+                Schedule,
+                "schedules",
+            )
+        )
     try:
-        today = request.today or datetime.now().strftime("%Y-%m-%d")
-        result = gen_schedules(request.missions, today)
+        result = speculated
+        if result is MISSING:
+            result = await agen_schedules(request.missions, today)
         # Convert the Pydantic model to dict
         return result.dict() if hasattr(result, "dict") else result
     except Exception as e:
@@ -322,187 +715,596 @@ async def generate_schedules(request: ScheduleRequest):
         )
 
 
-@app.post("/api/save-data")
-async def save_data(data: SaveDataRequest):
-    """Save milestones and tasks to database"""
+@app.post("/api/generate-plan")
+async def generate_plan(request: PlanRequest):
+    """Run goal -> status -> milestones -> missions -> schedules server-side,
+    streaming each stage as an SSE event as soon as it is ready"""
+
+    async def events():
+        stage = "goal"
+        plan = {}
+        try:
+            async for stage, result in agen_plan(
+                request.goal,
+                request.previous_status,
+                request.user_description,
+                request.today,
+            ):
+                # Same payloads as the matching /api/generate-* endpoint
+                if isinstance(result, BaseModel):
+                    plan[stage] = result.model_dump()
+                    yield sse_event(stage, plan[stage])
+                else:
+                    plan[stage] = result
+                    yield sse_event(stage, {stage: result})
+
+            if request.userid:
+                stage = "save"
+                saved = await persist_plan(
+                    SaveDataRequest(userid=request.userid, **plan)
+                )
+                yield sse_event("saved", saved)
+            yield sse_event("done", plan)
+        except Exception as e:
+            yield sse_event("error", {"stage": stage, "detail": str(e)})
+
+    return event_stream(events())
+
+
+async def persist_plan(data: SaveDataRequest, progress=None, resumed_from=None):
+    """Write a generated plan (milestones, tasks and their events) for a user.
+
+    With ``resumed_from`` (the progress an interrupted earlier attempt
+    recorded) the plan is written again over what that attempt left, instead
+    of being refused as already there.
+    """
     try:
-        user_status = (
+        return await write_plan(data, progress or (lambda **fields: None), resumed_from)
+    finally:
+        # Also after a partial failure, cached reads no longer match the tables
+        await plan_cache.invalidate(data.userid)
+
+
+async def write_plan(data: SaveDataRequest, progress, resumed_from=None):
+    user_status = await (
+        supabase_client.get_client()
+        .from_("users")
+        .select("status, goal")
+        .eq("user_id", data.userid)
+        .single()
+        .execute()
+    )
+    previous = user_status.data
+    rewrite = resumed_from is not None
+    if rewrite:
+        # The interrupted attempt already set the user to working; a failure
+        # should put back what that attempt found instead
+        previous = resumed_from.get("previous") or previous
+    if previous["status"] == "working" and not rewrite:
+        # User is already working on a task. Don't duplicate tasks
+        return {"message": "Data already exists", "user_id": data.userid}
+    # clear previous data in milestones and tasks first; on a rewrite that
+    # is the earlier attempt's, in the same transaction as the new rows
+    replace = previous["status"] == "finished" or rewrite
+
+    milestone_data = milestone_rows(data.userid, data.milestones)
+    task_data = task_rows(data.userid, data.schedules)
+    print("len task_data:", len(task_data))
+
+    progress(stage="tasks", tasks=len(task_data), previous=previous)
+    tasks = await write_plan_rows(data, replace, milestone_data, task_data)
+    print("Tasks saved successfully.")
+
+    events = task2events(tasks)
+    print("event created. length:", len(events))
+    progress(stage="events", events=len(events), saved=0, previous=previous)
+    try:
+        await insert_chunked(
+            "events",
+            events,
+            lambda saved: progress(
+                stage="events", events=len(events), saved=saved, previous=previous
+            ),
+        )
+    except Exception:
+        # Don't leave a plan behind whose events are only partly there
+        await undo_plan(data.userid, tasks, previous)
+        raise
+
+    return {"message": "Data saved successfully", "user_id": data.userid}
+
+
+async def undo_plan(user_id, tasks, previous):
+    """Remove what write_plan_rows wrote and put the user row back.
+
+    The user wasn't ``working`` before the save, so any older plan was
+    either replaced or never there, and all their milestones are this
+    save's. A replaced plan can't be brought back.
+    """
+    task_ids = [task["id"] for task in tasks]
+    if task_ids:
+        await (
             supabase_client.get_client()
-            .from_("users")
-            .select("status")
-            .eq("user_id", data.userid)
-            .single()
+            .from_("events")
+            .delete()
+            .in_("task_id", task_ids)
             .execute()
         )
-        if user_status == "working":
-            # User is already working on a task. Don't duplicate tasks
-            return {"message": "Data already exists", "user_id": data.userid}
-        if user_status == "finished":
-            # clear previous data in milestones and tasks first
-            supabase_client.get_client().from_("milestones").delete().eq(
-                "user_id", data.userid
-            ).execute()
-            supabase_client.get_client().from_("tasks").delete().eq(
-                "user_id", data.userid
-            ).execute()
-
-        # Update user's goal and status
-        user_update = (
+        await (
             supabase_client.get_client()
-            .from_("users")
-            .update({"goal": data.goal, "status": "working"})
-            .eq("user_id", data.userid)
+            .from_("tasks")
+            .delete()
+            .in_("id", task_ids)
             .execute()
         )
+    await (
+        supabase_client.get_client()
+        .from_("milestones")
+        .delete()
+        .eq("user_id", user_id)
+        .execute()
+    )
+    await (
+        supabase_client.get_client()
+        .from_("users")
+        .update({"status": previous["status"], "goal": previous["goal"]})
+        .eq("user_id", user_id)
+        .execute()
+    )
 
-        print("User update result:", user_update)
 
-        if hasattr(user_update, "error") and user_update.error:
-            raise HTTPException(
-                status_code=501, detail=f"Error updating user: {user_update.error}"
-            )
+async def write_plan_rows(data, replace, milestone_data, task_data):
+    """Update the user and insert milestones and tasks, returning the tasks.
 
-        # Save new milestones
-        milestone_data = []
-        for milestone in data.milestones.get("milestones", []):
-            milestone_data.append(
-                {
-                    "user_id": data.userid,
-                    "name": milestone.get("title", ""),
-                    "description": milestone.get("description", ""),
-                }
-            )
+    Uses the ``save_plan`` Postgres function (sql/save_plan.sql) so this is one
+    transaction and one round trip; falls back to separate requests while the
+    function is not deployed.
+    """
+    global save_plan_rpc
+    if save_plan_rpc:
+        from postgrest.exceptions import APIError
 
-        if milestone_data:
-            milestones_result = (
+        try:
+            tasks_result = await (
                 supabase_client.get_client()
-                .from_("milestones")
-                .insert(milestone_data)
+                .rpc(
+                    "save_plan",
+                    {
+                        "p_user_id": data.userid,
+                        "p_goal": data.goal,
+                        "p_replace": replace,
+                        "p_milestones": milestone_data,
+                        "p_tasks": task_data,
+                    },
+                )
                 .execute()
             )
+            return tasks_result.data
+        except APIError as e:
+            if e.code != "PGRST202":
+                raise
+            print("save_plan function not found, using separate requests")
+            save_plan_rpc = False
+
+    if replace:
+        old_tasks = await (
+            supabase_client.get_client()
+            .from_("tasks")
+            .select("id")
+            .eq("user_id", data.userid)
+            .execute()
+        )
+        old_task_ids = [task["id"] for task in old_tasks.data]
+        if old_task_ids:
+            await (
+                supabase_client.get_client()
+                .from_("events")
+                .delete()
+                .in_("task_id", old_task_ids)
+                .execute()
+            )
+        await asyncio.gather(
+            supabase_client.get_client()
+            .from_("milestones")
+            .delete()
+            .eq("user_id", data.userid)
+            .execute(),
+            supabase_client.get_client()
+            .from_("tasks")
+            .delete()
+            .eq("user_id", data.userid)
+            .execute(),
+        )
 
-            if hasattr(milestones_result, "error") and milestones_result.error:
-                raise HTTPException(
-                    status_code=502,
-                    detail=f"Error saving milestones: {milestones_result.error}",
-                )
-
-        # Save tasks (missions as tasks)
-        task_data = []
+    # Update user's goal and status
+    user_update = await (
+        supabase_client.get_client()
+        .from_("users")
+        .update({"goal": data.goal, "status": "working"})
+        .eq("user_id", data.userid)
+        .execute()
+    )
 
-        # Find corresponding milestone for each event in schedules
-        for event in data.schedules.get("events", []):
-            recurrence_time_required = (
-                int(event.get("recurrence", "").strip("=")[-1])
-                if event.get("recurrence")
-                else 1
-            )
-            start_time = event.get("start", {}).get("dateTime", "")
-            end_time = event.get("end", {}).get("dateTime", "")
-            task_data.append(
-                {
-                    "user_id": data.userid,
-                    "name": event.get("summary", ""),
-                    "recurrence": event.get("recurrence", ""),
-                    "recurrence_time_required": recurrence_time_required,
-                    "recurrence_time_done": 0,
-                    "start_timestamptz": start_time,
-                    "end_timestamptz": end_time,
-                }
-            )
+    print("User update result:", user_update)
 
-        print("len task_data:", len(task_data))
+    if hasattr(user_update, "error") and user_update.error:
+        raise HTTPException(
+            status_code=501, detail=f"Error updating user: {user_update.error}"
+        )
 
-        if task_data:
-            tasks_result = (
-                supabase_client.get_client().from_("tasks").insert(task_data).execute()
+    # Milestones and tasks don't depend on each other
+    _, tasks = await asyncio.gather(
+        insert_chunked("milestones", milestone_data),
+        insert_chunked("tasks", task_data),
+    )
+    return tasks
+
+
+async def insert_chunked(table, rows, on_progress=None, on_conflict=None):
+    """Insert ``rows`` in chunks of INSERT_CHUNK_SIZE, at most
+    INSERT_CONCURRENCY requests at a time, returning the inserted rows.
+    With ``on_conflict`` (unique columns) rows that already exist are
+    skipped instead."""
+    semaphore = asyncio.Semaphore(INSERT_CONCURRENCY)
+    saved = 0
+
+    async def insert(chunk):
+        async with semaphore:
+            query = supabase_client.get_client().from_(table)
+            if on_conflict is None:
+                query = query.insert(chunk)
+            else:
+                query = query.upsert(
+                    chunk, on_conflict=on_conflict, ignore_duplicates=True
+                )
+            result = await query.execute()
+        if hasattr(result, "error") and result.error:
+            raise HTTPException(
+                status_code=503, detail=f"Error saving {table}: {result.error}"
             )
+        if on_progress is not None:
+            nonlocal saved
+            saved += len(chunk)
+            on_progress(saved)
+        return result.data
+
+    # Every chunk settles before a failure is raised, so that cleanup after
+    # it doesn't race inserts still in flight
+    results = await asyncio.gather(
+        *[
+            insert(rows[i : i + INSERT_CHUNK_SIZE])
+            for i in range(0, len(rows), INSERT_CHUNK_SIZE)
+        ],
+        return_exceptions=True,
+    )
+    for result in results:
+        if isinstance(result, BaseException):
+            raise result
+    return [row for chunk in results for row in chunk]
 
-            if hasattr(tasks_result, "error") and tasks_result.error:
-                raise HTTPException(
-                    status_code=503,
-                    detail=f"Error saving tasks: {tasks_result.error}",
-                )
 
-            print("Tasks saved successfully.")
+@app.post("/api/save-data")
+async def save_data(data: SaveDataRequest, request: Request):
+    """Save milestones and tasks to database"""
+    if SAVE_DATA_BACKGROUND:
+        payload = data.model_dump()
+        if current_trace() is not None:
+            # Trace the job as well, linked back to this request's trace
+            payload["trace"] = current_trace().trace_id
+        job_id = request.app.state.job_queue.submit("save_plan", payload)
+        return JSONResponse(
+            status_code=202,
+            content={
+                "message": "Saving data",
+                "user_id": data.userid,
+                "job_id": job_id,
+                "status_url": f"/api/jobs/{job_id}",
+            },
+        )
+    try:
+        return await persist_plan(data)
+    except Exception as e:
+        raise HTTPException(status_code=504, detail=f"Error saving data: {str(e)}")
 
-            events = task2events(tasks_result.data)
-            print("event created. length:", len(events))
-            if events:
-                event_result = (
-                    supabase_client.get_client()
-                    .from_("events")
-                    .insert(events)
-                    .execute()
-                )
 
-                if hasattr(event_result, "error") and event_result.error:
-                    raise HTTPException(
-                        status_code=503,
-                        detail=f"Error saving events: {event_result.error}",
-                    )
+async def run_save_plan_job(payload, progress, resumed_from):
+    trace_id = payload.pop("trace", None)
+    # Progress is first recorded right before the rows are written, so an
+    # earlier run that recorded any may have committed them
+    with traced("job save_plan", trace_id is not None, requested_by=trace_id):
+        return await persist_plan(SaveDataRequest(**payload), progress, resumed_from)
 
-        return {"message": "Data saved successfully", "user_id": data.userid}
 
-    except Exception as e:
-        raise HTTPException(status_code=504, detail=f"Error saving data: {str(e)}")
+@app.get("/api/jobs/{job_id}")
+async def get_job(job_id: str, request: Request):
+    """Status, progress and result of a background job"""
+    job = request.app.state.job_queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
 
 
 @app.post("/api/back-get-status")
 async def get_status(userData: User):
     try:
-        user_status = (
-            supabase_client.get_client()
-            .from_("users")
-            .select("status")
-            .eq(
-                "user_id", userData.user_id
-            )  # Changed from userData.username to userData.user_id
-            .single()
-            .execute()
-        )
-        print("user status:", user_status)
+        user_rows = await load_user_rows(userData.user_id)
+        print("user status:", user_rows)
 
-        if not user_status.data:
+        if not user_rows:
             raise HTTPException(status_code=404, detail="User not found")
 
-        return {"status": user_status.data["status"]}
+        return {"status": user_rows[0]["status"]}
 
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error getting status: {str(e)}")
 
 
+def encode_cursor(event):
+    return base64.urlsafe_b64encode(
+        json.dumps([event["start"], event["id"]]).encode()
+    ).decode()
+
+
+def decode_cursor(cursor):
+    """``(start, id)`` of a cursor from ``encode_cursor``; ValueError if it
+    isn't one"""
+    try:
+        start, event_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        # Parsed so that only a timestamp ends up in the filter string
+        datetime.fromisoformat(start)
+        return start, int(event_id)
+    except (TypeError, ValueError) as e:
+        raise ValueError(f"Invalid cursor: {cursor!r}") from e
+
+
+def parse_timestamp(value, field):
+    try:
+        moment = datetime.fromisoformat(value)
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"{field} must be an ISO timestamp")
+    return moment if moment.tzinfo else moment.replace(tzinfo=timezone.utc)
+
+
 @app.post("/api/load-data")
-async def load_data(userData: User):
+async def load_data(request: LoadDataRequest):
+    """Events of a user's tasks, optionally limited to [start, end) and paged
+    by ``limit`` with the returned ``next_cursor``"""
+    if request.limit is not None and request.limit < 1:
+        raise HTTPException(status_code=400, detail="limit must be at least 1")
+    if request.start:
+        parse_timestamp(request.start, "start")
+    until = parse_timestamp(request.end, "end") if request.end else None
+    cursor = None
+    if request.cursor:
+        try:
+            cursor = decode_cursor(request.cursor)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
     try:
-        task_ids = (
+        try:
+            # The window only moves forward as time advances or a later
+            # range is asked for; rows created here show up in the query
+            await ensure_events_extended(request.user_id, until)
+        except Exception as e:
+            print(f"Extending events failed, serving what exists: {str(e)}")
+
+        # Filter on the owning task through an inner join instead of first
+        # collecting every task id; the empty embed returns no task columns
+        query = (
             supabase_client.get_client()
+            .from_("events")
+            .select(f"{EVENT_COLUMNS}, tasks!inner()")
+            .eq("tasks.user_id", request.user_id)
+        )
+        if request.start:
+            query = query.gte("start", request.start)
+        if request.end:
+            query = query.lt("start", request.end)
+        if cursor is not None:
+            start, event_id = cursor
+            query = query.or_(
+                f'start.gt."{start}",and(start.eq."{start}",id.gt.{event_id})'
+            )
+        query = query.order("start").order("id")
+        if request.limit:
+            # One extra row tells whether there is a next page
+            query = query.limit(min(request.limit, LOAD_DATA_MAX_LIMIT) + 1)
+
+        # Taken before the query so a flush finishing while it runs can't
+        # leave us with the old stored value
+        buffered = toggle_buffer.snapshot() if toggle_buffer is not None else {}
+
+        async def load():
+            return (await query.execute()).data
+
+        page = json.dumps([request.start, request.end, request.cursor, request.limit])
+        events = await plan_cache.get_or_load(request.user_id, f"events:{page}", load)
+        if toggle_buffer is not None:
+            # Toggles not yet flushed take precedence over the stored value
+            for event in events:
+                pending = toggle_buffer.get(event["id"], buffered.get(event["id"]))
+                if pending is not None:
+                    event["isDone"] = pending[0]
+        next_cursor = None
+        if request.limit and len(events) > min(request.limit, LOAD_DATA_MAX_LIMIT):
+            events = events[:-1]
+            next_cursor = encode_cursor(events[-1])
+
+        return {
+            "user_id": request.user_id,
+            "events": {"data": events},
+            "next_cursor": next_cursor,
+        }
+
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error getting status: {str(e)}")
+
+
+def etag_matches(if_none_match, etag):
+    if not if_none_match:
+        return False
+    tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+    return "*" in tags or etag in tags
+
+
+async def load_calendar_rows(user_id):
+    """A user's tasks and their events marked done, through the plan cache"""
+    # Taken before the queries, like in load_data
+    buffered = toggle_buffer.snapshot() if toggle_buffer is not None else {}
+
+    async def load_tasks():
+        return (
+            await supabase_client.get_client()
             .from_("tasks")
-            .select("id")
-            .eq("user_id", userData.user_id)
+            .select("*")
+            .eq("user_id", user_id)
+            .order("id")
             .execute()
-        )
+        ).data
 
-        # select all events that has task_id in task_ids
-        events = (
-            supabase_client.get_client()
+    async def load_done_events():
+        return (
+            await supabase_client.get_client()
             .from_("events")
-            .select("*")
-            .in_("task_id", [task["id"] for task in task_ids.data])
+            .select("id, task_id, start, end, tasks!inner()")
+            .eq("tasks.user_id", user_id)
+            .eq("isDone", True)
+            .order("start")
+            .order("id")
+            .execute()
+        ).data
+
+    tasks, done_events = await asyncio.gather(
+        plan_cache.get_or_load(user_id, "calendar:tasks", load_tasks),
+        plan_cache.get_or_load(user_id, "calendar:done", load_done_events),
+    )
+    done_events = [
+        {key: event[key] for key in ("id", "task_id", "start", "end")}
+        for event in done_events
+    ]
+    if toggle_buffer is not None:
+        # Toggles not yet flushed take precedence over the stored value
+        pending = {
+            event_id: is_done
+            for event_id, (is_done, owner) in {
+                **buffered,
+                **toggle_buffer.snapshot(),
+            }.items()
+            if owner == user_id
+        }
+        done_events = [event for event in done_events if pending.get(event["id"], True)]
+        known = {event["id"] for event in done_events}
+        missing = [
+            event_id
+            for event_id, is_done in pending.items()
+            if is_done and event_id not in known
+        ]
+        if missing:
+            result = await (
+                supabase_client.get_client()
+                .from_("events")
+                .select("id, task_id, start, end")
+                .in_("id", missing)
+                .execute()
+            )
+            done_events += result.data
+            # Same order as the query, so the ETag doesn't depend on the buffer
+            done_events.sort(key=lambda event: (event["start"], event["id"]))
+    return tasks, done_events
+
+
+async def calendar_feed_user(token):
+    """The user a calendar feed token belongs to, or None"""
+    token_hash = feed_token_hash(token)
+    user_id = calendar_feed_cache.get(token_hash)
+    if user_id is MISSING:
+        result = await (
+            supabase_client.get_client()
+            .from_("calendar_feeds")
+            .select("user_id")
+            .eq("token_hash", token_hash)
+            .limit(1)
             .execute()
         )
+        user_id = result.data[0]["user_id"] if result.data else None
+        calendar_feed_cache.set(token_hash, user_id)
+    return user_id
 
-        return {"user_id": userData.user_id, "events": events}
 
+@app.post("/api/calendar/token")
+async def rotate_calendar_token(token_data: TokenData = Depends(verify_token)):
+    """A new secret calendar feed URL for the user. The token is only shown
+    here; the user's previous feed URL stops working."""
+    token, token_hash = new_feed_token()
+    try:
+        client = supabase_client.get_client()
+        previous = await (
+            client.from_("calendar_feeds")
+            .select("token_hash")
+            .eq("user_id", token_data.user_id)
+            .execute()
+        )
+        await (
+            client.from_("calendar_feeds")
+            .upsert(
+                {
+                    "user_id": token_data.user_id,
+                    "token_hash": token_hash,
+                    "created_at": datetime.now(timezone.utc).isoformat(),
+                },
+                on_conflict="user_id",
+            )
+            .execute()
+        )
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error getting status: {str(e)}")
+        raise HTTPException(
+            status_code=500, detail=f"Error creating calendar token: {str(e)}"
+        )
+    for row in previous.data:
+        calendar_feed_cache.pop(row["token_hash"])
+    return {"token": token, "url": f"/api/calendar.ics?token={token}"}
+
+
+@app.get("/api/calendar.ics")
+async def calendar_ics(token: str, request: Request):
+    """A user's tasks as an iCalendar feed to subscribe to, one recurring
+    event per task with done occurrences folded in. Polling with
+    ``If-None-Match`` gets a 304 as long as nothing changed."""
+    try:
+        user_id = await calendar_feed_user(token)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error loading calendar: {str(e)}")
+    if user_id is None:
+        raise HTTPException(status_code=404, detail="Unknown calendar feed")
+    try:
+        tasks, done_events = await load_calendar_rows(user_id)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error loading calendar: {str(e)}")
+    etag = calendar_etag(tasks, done_events)
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+
+    async def chunks():
+        # One chunk per task; rendering is cheap enough for the event loop,
+        # while a sync iterator would cost a thread pool hop per chunk
+        for chunk in iter_calendar(tasks, done_events):
+            yield chunk
+
+    return StreamingResponse(
+        chunks(),
+        media_type="text/calendar; charset=utf-8",
+        headers={**headers, "Content-Disposition": 'inline; filename="calendar.ics"'},
+    )
 
 
 @app.post("/api/events/toggle")
 async def toggle_event_status(request: ToggleEventRequest):
+    if toggle_buffer is not None:
+        return await buffer_event_toggle(request)
     try:
         # Verify that the event belongs to the user by checking the task ownership
-        event_result = (
+        event_result = await (
             supabase_client.get_client()
             .from_("events")
             .select("id, task_id")
@@ -516,7 +1318,7 @@ async def toggle_event_status(request: ToggleEventRequest):
         event = event_result.data[0]
 
         # Check if the task belongs to the user
-        task_result = (
+        task_result = await (
             supabase_client.get_client()
             .from_("tasks")
             .select("id, user_id")
@@ -532,7 +1334,7 @@ async def toggle_event_status(request: ToggleEventRequest):
             )
 
         # Update the event's isDone status
-        update_result = (
+        update_result = await (
             supabase_client.get_client()
             .from_("events")
             .update({"isDone": request.is_done})
@@ -540,6 +1342,219 @@ async def toggle_event_status(request: ToggleEventRequest):
             .execute()
         )
 
+        await plan_cache.invalidate(request.user_id)
+
+        return {
+            "success": True,
+            "event_id": request.event_id,
+            "is_done": request.is_done,
+            "message": "Event status updated successfully",
+        }
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=500, detail=f"Error toggling event status: {str(e)}"
+        )
+
+
+async def owned_event_ids(user_id, event_ids):
+    """Subset of ``event_ids`` whose task belongs to ``user_id``, in one query"""
+    result = await (
+        supabase_client.get_client()
+        .from_("events")
+        .select("id, tasks!inner()")
+        .in_("id", list(event_ids))
+        .eq("tasks.user_id", user_id)
+        .execute()
+    )
+    return {event["id"] for event in result.data}
+
+
+async def apply_event_toggles(toggles):
+    """Write ``{event_id: is_done}`` with one bulk UPDATE per target value"""
+    by_value = {}
+    for event_id, is_done in toggles.items():
+        by_value.setdefault(is_done, []).append(event_id)
+    await asyncio.gather(
+        *[
+            supabase_client.get_client()
+            .from_("events")
+            .update({"isDone": is_done})
+            .in_("id", event_ids)
+            .execute()
+            for is_done, event_ids in by_value.items()
+        ]
+    )
+
+
+async def flush_event_toggles(entries):
+    """Flush ``{event_id: (is_done, user_id)}`` from the write-behind buffer"""
+    await apply_event_toggles(
+        {event_id: is_done for event_id, (is_done, _) in entries.items()}
+    )
+    # Reads cached while the toggles were buffered hold the old stored value
+    for user_id in {user_id for _, user_id in entries.values()}:
+        await plan_cache.invalidate(user_id)
+
+
+@app.post("/api/events/toggle-batch")
+async def toggle_events_batch(request: ToggleEventsBatchRequest):
+    """Toggle many events with one ownership check and at most two updates"""
+    try:
+        # Later entries for the same event win
+        toggles = {toggle.event_id: toggle.is_done for toggle in request.events}
+        if not toggles:
+            return {"success": True, "results": []}
+
+        owned = await owned_event_ids(request.user_id, toggles)
+        owned_toggles = {
+            event_id: toggles[event_id] for event_id in toggles if event_id in owned
+        }
+        if toggle_buffer is not None:
+            for event_id, is_done in owned_toggles.items():
+                event_owner_cache.set((request.user_id, event_id), True)
+                toggle_buffer.put(event_id, (is_done, request.user_id))
+        else:
+            await apply_event_toggles(owned_toggles)
+        await plan_cache.invalidate(request.user_id)
+
+        results = []
+        for event_id, is_done in toggles.items():
+            result = {"event_id": event_id, "is_done": is_done}
+            if event_id in owned:
+                result["success"] = True
+            else:
+                result["success"] = False
+                result["error"] = "Event not found or not authorized"
+            results.append(result)
+
+        return {"success": len(owned) == len(toggles), "results": results}
+
+    except Exception as e:
+        raise HTTPException(
+            status_code=500, detail=f"Error toggling event status: {str(e)}"
+        )
+
+
+async def extend_user_rows(user_id, until=None):
+    """Materialise the next part of each task's rolling event window, up to
+    ``until`` if that is later than the usual horizon. Returns the number of
+    events created."""
+    tasks = await (
+        supabase_client.get_client()
+        .from_("tasks")
+        .select("*")
+        .eq("user_id", user_id)
+        .execute()
+    )
+
+    async def latest_event(task):
+        return await (
+            supabase_client.get_client()
+            .from_("events")
+            .select("start", count="exact")
+            .eq("task_id", task["id"])
+            .order("start", desc=True)
+            .limit(1)
+            .execute()
+        )
+
+    latest = await asyncio.gather(*[latest_event(task) for task in tasks.data])
+
+    events = []
+    for task, latest_result in zip(tasks.data, latest):
+        task_until = None
+        if until is not None:
+            start = datetime.fromisoformat(task["start_timestamptz"])
+            task_until = max(horizon_end(start), until)
+        if latest_result.data:
+            events.extend(
+                extend_events(
+                    task,
+                    latest_result.data[0]["start"],
+                    latest_result.count,
+                    until=task_until,
+                )
+            )
+        else:
+            # Nothing materialised yet, e.g. the task starts past the window
+            events.extend(task2events([task], until=task_until))
+
+    if events:
+        await insert_extension_events(events)
+        await plan_cache.invalidate(user_id)
+    return len(events)
+
+
+async def insert_extension_events(events):
+    """Insert extension events, skipping occurrences that another process
+    extending the same user at the same time has already inserted"""
+    global events_unique
+    if events_unique:
+        from postgrest.exceptions import APIError
+
+        try:
+            return await insert_chunked("events", events, on_conflict="task_id,start")
+        except APIError as e:
+            # 42P10: no unique constraint matching the ON CONFLICT columns
+            if e.code != "42P10":
+                raise
+            print("events (task_id, start) constraint not found, using inserts")
+            events_unique = False
+    return await insert_chunked("events", events)
+
+
+async def ensure_events_extended(user_id, until=None):
+    """Extend the user's events when ``until`` (default: the usual horizon
+    from now) is past what was last ensured, at most every
+    ``EVENT_EXTEND_INTERVAL`` seconds otherwise"""
+    extended = events_extended.get(user_id)
+    # The usual horizon moves with the clock, so it counts as covered until
+    # the entry expires
+    if extended is not MISSING and (until is None or until <= extended):
+        return
+    needed = datetime.now(timezone.utc) + timedelta(days=EVENT_HORIZON_DAYS)
+    if until is not None:
+        needed = max(needed, until)
+
+    async def extend():
+        await extend_user_rows(user_id, until)
+        events_extended.set(user_id, needed)
+
+    await extend_flight.do(user_id, extend)
+
+
+@app.post("/api/events/extend")
+async def extend_user_events(userData: User):
+    """Materialise the next part of each task's rolling event window"""
+    try:
+        created = await extend_user_rows(userData.user_id)
+        events_extended.set(
+            userData.user_id,
+            datetime.now(timezone.utc) + timedelta(days=EVENT_HORIZON_DAYS),
+        )
+        return {"user_id": userData.user_id, "created": created}
+
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error extending events: {str(e)}")
+
+
+async def buffer_event_toggle(request: ToggleEventRequest):
+    """Write-behind variant of toggle_event_status"""
+    try:
+        owner_key = (request.user_id, request.event_id)
+        if event_owner_cache.get(owner_key) is MISSING:
+            if not await owned_event_ids(request.user_id, [request.event_id]):
+                raise HTTPException(
+                    status_code=403, detail="Not authorized to modify this event"
+                )
+            event_owner_cache.set(owner_key, True)
+
+        toggle_buffer.put(request.event_id, (request.is_done, request.user_id))
+        await plan_cache.invalidate(request.user_id)
+
         return {
             "success": True,
             "event_id": request.event_id,
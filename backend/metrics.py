@@ -0,0 +1,231 @@
+"""Prometheus metrics for the backend, exposed on ``GET /metrics``.
+
+- ``http_request_duration_seconds``: per route template, method and status,
+  measured until the last body chunk is sent (so SSE streams count in full)
+- ``supabase_request_duration_seconds``: per table (or RPC) and operation
+- ``llm_request_duration_seconds``, ``llm_tokens_total``, ``llm_errors_total``:
+  per ``gen_*`` stage; cache hits never reach the API and are not counted
+- ``llm_dedup_requests_total``: ``result="shared"`` over all is the rate at
+  which identical concurrent completions were collapsed into one
+- ``admission_in_flight``, ``admission_queue_depth``,
+  ``admission_queue_wait_seconds``, ``admission_rejected_requests_total``:
+  the ``/api/generate-*`` admission control (admission.py)
+- ``speculation_requests_total``: ``result="hit"`` over all is the hit rate of
+  speculatively generated stages; ``speculation_discarded_total`` and
+  ``speculation_wasted_tokens_total`` count the ones nobody asked for
+- ``task2events_duration_seconds``, ``task2events_occurrences``
+
+Metrics live in the process, so with several workers each one reports its own.
+"""
+
+import time
+from contextvars import ContextVar
+from urllib.parse import urlsplit
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+)
+
+LATENCY_BUCKETS = (
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+    30.0,
+    60.0,
+)
+
+HTTP_REQUEST_DURATION = Histogram(
+    "http_request_duration_seconds",
+    "Time spent handling HTTP requests",
+    ["method", "route", "status"],
+    buckets=LATENCY_BUCKETS,
+)
+SUPABASE_REQUEST_DURATION = Histogram(
+    "supabase_request_duration_seconds",
+    "Supabase round trips until the response headers arrive",
+    ["table", "operation", "status"],
+    buckets=LATENCY_BUCKETS,
+)
+LLM_REQUEST_DURATION = Histogram(
+    "llm_request_duration_seconds",
+    "Successful completion requests to the LLM API",
+    ["stage", "model"],
+    buckets=LATENCY_BUCKETS,
+)
+LLM_TOKENS = Counter(
+    "llm_tokens_total",
+    "Tokens billed by the LLM API",
+    ["stage", "model", "kind"],
+)
+LLM_ERRORS = Counter(
+    "llm_errors_total",
+    "Failed completion requests, including ones that were retried",
+    ["stage", "model", "error"],
+)
+LLM_DEDUP = Counter(
+    "llm_dedup_requests_total",
+    "Cache misses by whether they started an upstream request or joined an "
+    "identical one already in flight",
+    ["stage", "result"],
+)
+ADMISSION_IN_FLIGHT = Gauge(
+    "admission_in_flight",
+    "LLM-backed requests holding a concurrency slot",
+)
+ADMISSION_QUEUE_DEPTH = Gauge(
+    "admission_queue_depth",
+    "LLM-backed requests waiting for a concurrency slot",
+)
+ADMISSION_QUEUE_WAIT = Histogram(
+    "admission_queue_wait_seconds",
+    "Time admitted or timed out requests spent waiting for a concurrency slot",
+    buckets=(0, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0),
+)
+ADMISSION_REJECTED = Counter(
+    "admission_rejected_requests_total",
+    "Requests answered with 429 by admission control",
+    ["reason"],
+)
+SPECULATION_REQUESTS = Counter(
+    "speculation_requests_total",
+    "Requests for a stage that could have been generated speculatively, by "
+    "whether a matching speculative result was there",
+    ["stage", "result"],
+)
+SPECULATION_DISCARDED = Counter(
+    "speculation_discarded_total",
+    "Speculative results that expired or were evicted without being used",
+    ["stage"],
+)
+SPECULATION_WASTED_TOKENS = Counter(
+    "speculation_wasted_tokens_total",
+    "Tokens billed for discarded speculative results",
+    ["stage", "kind"],
+)
+TASK2EVENTS_DURATION = Histogram(
+    "task2events_duration_seconds",
+    "Time spent expanding task recurrences into events",
+    buckets=(0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0),
+)
+TASK2EVENTS_OCCURRENCES = Histogram(
+    "task2events_occurrences",
+    "Events produced per task2events call",
+    buckets=(0, 10, 50, 100, 500, 1000, 5000, 10000, 50000),
+)
+
+SUPABASE_OPERATIONS = {
+    "GET": "select",
+    "HEAD": "select",
+    "POST": "insert",
+    "PATCH": "update",
+    "PUT": "upsert",
+    "DELETE": "delete",
+}
+
+
+def render_metrics():
+    """Body and content type for the ``/metrics`` response"""
+    return generate_latest(), CONTENT_TYPE_LATEST
+
+
+class MetricsMiddleware:
+    """ASGI middleware that records ``HTTP_REQUEST_DURATION``.
+
+    Requests are labelled with the matched route template (``/api/jobs/{job_id}``)
+    rather than the raw path, and unmatched paths share one label, to keep the
+    number of series bounded.
+    """
+
+    def __init__(self, app) -> None:
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        status = 500
+        begin = time.perf_counter()
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            route = scope.get("route")
+            HTTP_REQUEST_DURATION.labels(
+                scope["method"],
+                getattr(route, "path", "unmatched"),
+                str(status),
+            ).observe(time.perf_counter() - begin)
+
+
+def _supabase_labels(request):
+    path = urlsplit(str(request.url)).path
+    _, _, rest = path.partition("/rest/v1/")
+    if not rest:
+        # auth/storage endpoints: label by service
+        return path.strip("/").split("/")[0] or "-", request.method.lower()
+    if rest.startswith("rpc/"):
+        return rest[len("rpc/") :], "rpc"
+    operation = SUPABASE_OPERATIONS.get(request.method, request.method.lower())
+    if operation == "insert" and "merge-duplicates" in request.headers.get(
+        "prefer", ""
+    ):
+        operation = "upsert"
+    return rest.split("/")[0], operation
+
+
+async def _supabase_request_started(request):
+    request.extensions["metrics_started"] = time.perf_counter()
+
+
+async def _supabase_response_received(response):
+    request = response.request
+    started = request.extensions.get("metrics_started")
+    if started is None:
+        return
+    table, operation = _supabase_labels(request)
+    SUPABASE_REQUEST_DURATION.labels(
+        table, operation, str(response.status_code)
+    ).observe(time.perf_counter() - started)
+
+
+# httpx event_hooks for the client the Supabase SDK sends its requests through
+SUPABASE_EVENT_HOOKS = {
+    "request": [_supabase_request_started],
+    "response": [_supabase_response_received],
+}
+
+
+# Set to a list to also collect the usage of every completion requested in
+# the current context (and tasks started from it)
+llm_usage = ContextVar("llm_usage", default=None)
+
+
+def observe_llm_response(stage, model, elapsed, usage):
+    LLM_REQUEST_DURATION.labels(stage, model).observe(elapsed)
+    collected = llm_usage.get()
+    if collected is not None and usage is not None:
+        collected.append(usage)
+    if usage is not None:
+        LLM_TOKENS.labels(stage, model, "input").inc(usage.input_tokens)
+        LLM_TOKENS.labels(stage, model, "output").inc(usage.output_tokens)
+
+
+def observe_llm_error(stage, model, error):
+    LLM_ERRORS.labels(stage, model, type(error).__name__).inc()
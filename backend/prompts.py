@@ -4,3 +4,4 @@ gen_milestone_prompt = "From the given goal and user status, provide a list of m
 gen_mission_prompt = "To achieve the given goal, status, and milestones, provide a list of missions for the user to complete in a reasonable time period, and specify the needed duration (in minute) and recurrence count for each mission. \
     The missions should be specific and achievable. Goal: {goal}. Status: {status}. Milestones: {milestones}."
 gen_schedule_prompt = "For the given missions, schedule them in a reasonable time period. Use a short and clear summary for each mission. Make sure the recurrence follows the iCalendar rrule format. Missions: {missions}. Today is {today}."
+gen_summary_prompt = "For each of the given missions, write a short and clear calendar event title. Return exactly one title per mission, in the same order. Missions: {missions}."
@@ -0,0 +1,224 @@
+"""Deterministic scheduler: packs missions into a calendar without the LLM.
+
+Every mission becomes one recurring event. Its ``recurrence`` occurrences are
+spread evenly over ``horizon_days`` (every day at most, every week at least),
+starting from ``today``, and each one is placed at the earliest time inside
+the daily working window that doesn't overlap any occurrence of a mission
+placed before it. Longer missions are placed first.
+
+The output has the ``ScheduleList`` shape, with ``RRULE:FREQ=DAILY`` or
+``WEEKLY`` rules that ``util.simple_rule`` understands.
+
+``resolve_overlaps`` applies the same kind of placement to schedules that
+were put together from several LLM calls.
+"""
+
+import os
+from datetime import date, datetime, time, timedelta
+from zoneinfo import ZoneInfo
+
+from util import iter_task_events
+
+SCHEDULE_TIMEZONE = os.getenv("SCHEDULE_TIMEZONE", "Asia/Taipei")
+SCHEDULE_DAY_START = os.getenv("SCHEDULE_DAY_START", "09:00")
+SCHEDULE_DAY_END = os.getenv("SCHEDULE_DAY_END", "21:00")
+SCHEDULE_HORIZON_DAYS = int(os.getenv("SCHEDULE_HORIZON_DAYS", "28"))
+# Start times are multiples of this many minutes
+SCHEDULE_GRANULARITY = int(os.getenv("SCHEDULE_GRANULARITY", "15"))
+
+
+def _minutes(hhmm):
+    hours, _, minutes = hhmm.partition(":")
+    return int(hours) * 60 + int(minutes or 0)
+
+
+def _period(recurrence, horizon_days):
+    """Days between two occurrences"""
+    return min(max(horizon_days // max(recurrence, 1), 1), 7)
+
+
+def _rrule(period, count):
+    if period == 7:
+        return f"RRULE:FREQ=WEEKLY;COUNT={count}"
+    if period == 1:
+        return f"RRULE:FREQ=DAILY;COUNT={count}"
+    return f"RRULE:FREQ=DAILY;INTERVAL={period};COUNT={count}"
+
+
+def _place(duration, period, count, placed, window_start, window_end, step):
+    """Earliest ``(first day, start minute)`` whose occurrences don't overlap
+    anything in ``placed``; later first days are tried until one fits."""
+    latest_start = max(window_end - duration, window_start)
+    first_day = 0
+    while True:
+        days = set(range(first_day, first_day + period * count, period))
+        for start in range(window_start, latest_start + 1, step):
+            end = start + duration
+            if not any(
+                start < other_end and other_start < end and not days.isdisjoint(other)
+                for other, other_start, other_end in placed
+            ):
+                return first_day, start, days
+        first_day += 1
+
+
+def schedule_missions(
+    missions,
+    today=None,
+    time_zone=SCHEDULE_TIMEZONE,
+    day_start=SCHEDULE_DAY_START,
+    day_end=SCHEDULE_DAY_END,
+    horizon_days=SCHEDULE_HORIZON_DAYS,
+    granularity=SCHEDULE_GRANULARITY,
+):
+    """``ScheduleList`` dict for ``missions`` (``Mission`` dicts), in input order"""
+    tz = ZoneInfo(time_zone)
+    first_date = date.fromisoformat(today) if today else datetime.now(tz).date()
+    window_start = _minutes(day_start)
+    window_end = _minutes(day_end)
+    window = max(window_end - window_start, granularity)
+
+    order = sorted(
+        range(len(missions)),
+        key=lambda i: -int(missions[i].get("duration") or 0),
+    )
+    placed = []
+    events = [None] * len(missions)
+    for i in order:
+        mission = missions[i]
+        # Round up to the grid, and never longer than the working window
+        duration = int(mission.get("duration") or granularity)
+        duration = min(-(-max(duration, 1) // granularity) * granularity, window)
+        count = max(int(mission.get("recurrence") or 1), 1)
+        period = _period(count, horizon_days)
+        first_day, start, days = _place(
+            duration,
+            period,
+            count,
+            placed,
+            window_start,
+            window_start + window,
+            granularity,
+        )
+        placed.append((days, start, start + duration))
+
+        starts_at = datetime.combine(
+            first_date + timedelta(days=first_day),
+            time(start // 60, start % 60),
+            tzinfo=tz,
+        )
+        ends_at = starts_at + timedelta(minutes=duration)
+        events[i] = {
+            "summary": mission.get("title", ""),
+            "start": {"dateTime": starts_at.isoformat(), "timeZone": time_zone},
+            "end": {"dateTime": ends_at.isoformat(), "timeZone": time_zone},
+            "recurrence": _rrule(period, count),
+        }
+    return {"events": events}
+
+
+def _occurrences(event):
+    """``(start, end)`` of every materialised occurrence of a ScheduleList
+    event dict, the same way saving the plan expands it"""
+    task = {
+        "id": 0,
+        "name": "",
+        "start_timestamptz": event["start"]["dateTime"],
+        "end_timestamptz": event["end"]["dateTime"],
+        "recurrence": event.get("recurrence") or "",
+    }
+    if task["recurrence"].strip():
+        rows = iter_task_events(task)
+    else:
+        rows = [{"start": task["start_timestamptz"], "end": task["end_timestamptz"]}]
+    return [
+        (datetime.fromisoformat(row["start"]), datetime.fromisoformat(row["end"]))
+        for row in rows
+    ]
+
+
+def _day(moment):
+    return moment.astimezone(ZoneInfo("UTC")).date()
+
+
+def _is_free(occurrences, booked):
+    for start, end in occurrences:
+        day = _day(start)
+        for other_day in (day - timedelta(days=1), day, day + timedelta(days=1)):
+            for other_start, other_end in booked.get(other_day, ()):
+                if start < other_end and other_start < end:
+                    return False
+    return True
+
+
+def _book(occurrences, booked):
+    for start, end in occurrences:
+        booked.setdefault(_day(start), []).append((start, end))
+
+
+def _with_start(event, start, duration):
+    return {
+        **event,
+        "start": {**event["start"], "dateTime": start.isoformat()},
+        "end": {**event["end"], "dateTime": (start + duration).isoformat()},
+    }
+
+
+def _move(event, booked, window_start, window_end, step, max_days):
+    """``event`` at the free start closest to its own, trying its own day
+    first and then the following ones, with its occurrences; ``None`` if
+    nothing fits"""
+    start = datetime.fromisoformat(event["start"]["dateTime"])
+    duration = datetime.fromisoformat(event["end"]["dateTime"]) - start
+    own_minute = start.hour * 60 + start.minute
+    length = int(duration.total_seconds() // 60)
+    minutes = sorted(
+        range(window_start, max(window_end - length, window_start) + 1, step),
+        key=lambda minute: abs(minute - own_minute),
+    )
+    for days in range(max_days):
+        # Expanded once per day; moving within a day shifts every occurrence
+        # by the same amount
+        day_start = start + timedelta(days=days)
+        occurrences = _occurrences(_with_start(event, day_start, duration))
+        for minute in minutes:
+            candidate = datetime.combine(
+                day_start.date(), time(minute // 60, minute % 60), tzinfo=start.tzinfo
+            )
+            shift = candidate - day_start
+            shifted = [(begin + shift, end + shift) for begin, end in occurrences]
+            if _is_free(shifted, booked):
+                return _with_start(event, candidate, duration), shifted
+    return None
+
+
+def resolve_overlaps(
+    events,
+    day_start=SCHEDULE_DAY_START,
+    day_end=SCHEDULE_DAY_END,
+    granularity=SCHEDULE_GRANULARITY,
+    max_days=7,
+):
+    """``events`` (ScheduleList event dicts) with every event whose
+    occurrences overlap an earlier event's moved to the nearest free time in
+    the working window, within ``max_days`` of its own start. Events that
+    can't be expanded or moved are left as they are."""
+    window_start = _minutes(day_start)
+    window_end = _minutes(day_end)
+    booked = {}
+    resolved = []
+    for event in events:
+        try:
+            occurrences = _occurrences(event)
+            if not _is_free(occurrences, booked):
+                moved = _move(
+                    event, booked, window_start, window_end, granularity, max_days
+                )
+                if moved is not None:
+                    event, occurrences = moved
+        except (KeyError, TypeError, ValueError):
+            resolved.append(event)
+            continue
+        _book(occurrences, booked)
+        resolved.append(event)
+    return resolved
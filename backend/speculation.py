@@ -0,0 +1,140 @@
+"""Speculative pre-generation of the next onboarding stage.
+
+While the user reviews the milestones (or missions) they were just given,
+the next stage is generated in the background from the unmodified result
+and kept for ``SPECULATION_TTL`` seconds. A request for that stage with
+exactly the same inputs takes the speculative result, waiting for it if it
+is still running; a request with edited inputs doesn't match and is
+generated as usual. Unused speculations are discarded once they expire or
+are pushed out by newer ones, and the tokens they cost count as wasted.
+"""
+
+import asyncio
+import hashlib
+import json
+import os
+import time
+from collections import OrderedDict
+
+from cache import MISSING
+from metrics import (
+    SPECULATION_DISCARDED,
+    SPECULATION_REQUESTS,
+    SPECULATION_WASTED_TOKENS,
+    llm_usage,
+)
+
+SPECULATION = os.getenv("SPECULATION", "0") == "1"
+SPECULATION_TTL = float(os.getenv("SPECULATION_TTL", "300"))
+SPECULATION_MAX_ENTRIES = int(os.getenv("SPECULATION_MAX_ENTRIES", "256"))
+
+
+def _consume_exception(task):
+    # Failed speculations are only reported to a request that claims them
+    if not task.cancelled():
+        task.exception()
+
+
+class _Speculation:
+    def __init__(self, stage, task, usage, expires_at) -> None:
+        self.stage = stage
+        self.task = task
+        # Usage of the completions this speculation requested
+        self.usage = usage
+        self.expires_at = expires_at
+
+
+class Speculator:
+    def __init__(
+        self, ttl=SPECULATION_TTL, maxsize=SPECULATION_MAX_ENTRIES, timer=time.monotonic
+    ) -> None:
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self.timer = timer
+        # key -> _Speculation, oldest first (which is also expiry order)
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.discarded = 0
+        self.wasted_tokens = 0
+
+    @staticmethod
+    def key(stage, args):
+        blob = json.dumps(args, sort_keys=True, default=str)
+        return f"{stage}:{hashlib.sha256(blob.encode()).hexdigest()}"
+
+    def start(self, stage, args, fn):
+        """Run ``fn(*args)`` in the background for a later ``claim(stage, args)``"""
+        self._expire()
+        key = self.key(stage, args)
+        if key in self._entries:
+            return
+        usage = []
+
+        async def run():
+            llm_usage.set(usage)
+            return await fn(*args)
+
+        task = asyncio.create_task(run())
+        task.add_done_callback(_consume_exception)
+        self._entries[key] = _Speculation(stage, task, usage, self.timer() + self.ttl)
+        while len(self._entries) > self.maxsize:
+            self._discard(self._entries.popitem(last=False)[1])
+
+    async def claim(self, stage, args):
+        """The speculative result of ``stage`` for ``args``, or ``MISSING``
+        when there is none or it failed"""
+        self._expire()
+        entry = self._entries.pop(self.key(stage, args), None)
+        if entry is None:
+            self.misses += 1
+            SPECULATION_REQUESTS.labels(stage, "miss").inc()
+            return MISSING
+        try:
+            result = await entry.task
+        except Exception:
+            self.misses += 1
+            SPECULATION_REQUESTS.labels(stage, "failed").inc()
+            return MISSING
+        self.hits += 1
+        SPECULATION_REQUESTS.labels(stage, "hit").inc()
+        return result
+
+    def _expire(self):
+        now = self.timer()
+        while self._entries:
+            key, entry = next(iter(self._entries.items()))
+            if entry.expires_at > now:
+                break
+            del self._entries[key]
+            self._discard(entry)
+
+    def _discard(self, entry):
+        # Tokens of a completion cancelled midway are not known and not counted
+        entry.task.cancel()
+        input_tokens = sum(usage.input_tokens for usage in entry.usage)
+        output_tokens = sum(usage.output_tokens for usage in entry.usage)
+        self.discarded += 1
+        self.wasted_tokens += input_tokens + output_tokens
+        SPECULATION_DISCARDED.labels(entry.stage).inc()
+        SPECULATION_WASTED_TOKENS.labels(entry.stage, "input").inc(input_tokens)
+        SPECULATION_WASTED_TOKENS.labels(entry.stage, "output").inc(output_tokens)
+
+    def stats(self):
+        self._expire()
+        total = self.hits + self.misses
+        return {
+            "pending": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / total if total else 0.0,
+            "discarded": self.discarded,
+            "wasted_tokens": self.wasted_tokens,
+        }
+
+    async def aclose(self):
+        """Cancel everything still pending, without counting it as wasted"""
+        entries, self._entries = list(self._entries.values()), OrderedDict()
+        for entry in entries:
+            entry.task.cancel()
+        await asyncio.gather(*[entry.task for entry in entries], return_exceptions=True)
@@ -0,0 +1,11 @@
+-- Secret tokens of the /api/calendar.ics feeds, one per user. Only the
+-- SHA-256 of a token is stored; the token itself is shown once, by
+-- POST /api/calendar/token, which also replaces the previous one.
+--
+-- Apply once in the Supabase SQL editor or with `psql -f calendar_feeds.sql`.
+
+create table if not exists calendar_feeds (
+    user_id text primary key references users (user_id) on delete cascade,
+    token_hash text not null unique,
+    created_at timestamptz not null default now()
+);
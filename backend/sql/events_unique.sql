@@ -0,0 +1,18 @@
+-- One event per task and start time, so that extending a user's event
+-- window (load_data, /api/events/extend) from several worker processes at
+-- once can't materialise the same occurrence twice: extensions are inserted
+-- with ON CONFLICT DO NOTHING against this constraint.
+--
+-- Apply once in the Supabase SQL editor or with `psql -f events_unique.sql`.
+-- The backend falls back to plain inserts while it is missing.
+
+-- Drop duplicates left by earlier concurrent extensions, keeping the one
+-- marked done if any, else the oldest
+delete from events a
+using events b
+where a.task_id = b.task_id
+    and a.start = b.start
+    and (b."isDone" > a."isDone" or (b."isDone" = a."isDone" and b.id < a.id));
+
+alter table events
+    add constraint events_task_id_start_key unique (task_id, start);
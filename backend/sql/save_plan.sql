@@ -0,0 +1,55 @@
+-- Writes the user update, milestones and tasks of a generated plan in one
+-- transaction and returns the inserted tasks, so /api/save-data needs a
+-- single round trip before inserting the (chunked) events.
+--
+-- Apply once in the Supabase SQL editor or with `psql -f save_plan.sql`.
+-- The backend falls back to separate requests while it is missing.
+
+create or replace function save_plan(
+    p_user_id text,
+    p_goal text,
+    p_replace boolean,
+    p_milestones jsonb,
+    p_tasks jsonb
+)
+returns setof tasks
+language plpgsql
+as $$
+begin
+    if p_replace then
+        -- Events too, so that re-running an interrupted save replaces the
+        -- rows it had already written
+        delete from events
+        where task_id in (select id from tasks where user_id = p_user_id);
+        delete from milestones where user_id = p_user_id;
+        delete from tasks where user_id = p_user_id;
+    end if;
+
+    update users set goal = p_goal, status = 'working' where user_id = p_user_id;
+
+    insert into milestones (user_id, name, description)
+    select p_user_id, m ->> 'name', m ->> 'description'
+    from jsonb_array_elements(p_milestones) as m;
+
+    return query
+    insert into tasks (
+        user_id,
+        name,
+        recurrence,
+        recurrence_time_required,
+        recurrence_time_done,
+        start_timestamptz,
+        end_timestamptz
+    )
+    select
+        p_user_id,
+        t ->> 'name',
+        t ->> 'recurrence',
+        (t ->> 'recurrence_time_required')::int,
+        (t ->> 'recurrence_time_done')::int,
+        (t ->> 'start_timestamptz')::timestamptz,
+        (t ->> 'end_timestamptz')::timestamptz
+    from jsonb_array_elements(p_tasks) as t
+    returning *;
+end;
+$$;
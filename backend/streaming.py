@@ -0,0 +1,86 @@
+import json
+
+
+def sse_event(event, data):
+    """Format one Server-Sent Event with a JSON payload"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+class JsonArrayItemParser:
+    """Incrementally pick complete objects out of a streamed JSON document.
+
+    Meant for structured outputs shaped like ``{"milestones": [{...}, ...]}``:
+    every object that is a direct element of an array nested in the top-level
+    object is returned by ``feed`` as soon as its closing brace arrives.
+    """
+
+    def __init__(self) -> None:
+        self.buffer = ""
+        self.pos = 0
+        self.stack = []
+        self.in_string = False
+        self.escape = False
+        self.item_start = None
+
+    def feed(self, chunk):
+        self.buffer += chunk
+        items = []
+        while self.pos < len(self.buffer):
+            char = self.buffer[self.pos]
+            if self.in_string:
+                if self.escape:
+                    self.escape = False
+                elif char == "\\":
+                    self.escape = True
+                elif char == '"':
+                    self.in_string = False
+            elif char == '"':
+                self.in_string = True
+            elif char in "{[":
+                if char == "{" and self.stack == ["{", "["]:
+                    self.item_start = self.pos
+                self.stack.append(char)
+            elif char in "}]":
+                self.stack.pop()
+                if char == "}" and self.stack == ["{", "["]:
+                    items.append(
+                        json.loads(self.buffer[self.item_start : self.pos + 1])
+                    )
+                    self.item_start = None
+            self.pos += 1
+
+        # Drop everything that can no longer be part of an item
+        keep = self.pos if self.item_start is None else self.item_start
+        self.buffer = self.buffer[keep:]
+        self.pos -= keep
+        if self.item_start is not None:
+            self.item_start = 0
+        return items
+
+
+async def sse_text(deltas, field):
+    """Relay text deltas as ``token`` events, then the full text as ``done``"""
+    chunks = []
+    try:
+        async for delta in deltas:
+            chunks.append(delta)
+            yield sse_event("token", {"text": delta})
+        yield sse_event("done", {field: "".join(chunks)})
+    except Exception as e:
+        yield sse_event("error", {"detail": f"Error generating {field}: {str(e)}"})
+
+
+async def sse_items(deltas, text_format, item_format, field):
+    """Emit each list element as an ``item`` event once its JSON is complete,
+    then the validated ``text_format`` result as ``done``"""
+    parser = JsonArrayItemParser()
+    chunks = []
+    try:
+        async for delta in deltas:
+            chunks.append(delta)
+            for item in parser.feed(delta):
+                yield sse_event("item", item_format.model_validate(item).model_dump())
+        result = text_format.model_validate_json("".join(chunks))
+        yield sse_event("done", result.model_dump())
+    except Exception as e:
+        yield sse_event("error", {"detail": f"Error generating {field}: {str(e)}"})
@@ -0,0 +1,305 @@
+"""Opt-in request tracing and sampling profiler.
+
+Nothing is recorded unless ``TRACING=1``. A request is then traced when it
+sends ``X-Trace: 1`` or falls into the ``TRACE_SAMPLE_RATE`` fraction, and
+profiled when it sends ``X-Profile: 1`` or falls into ``PROFILE_SAMPLE_RATE``.
+
+A trace has a span for the request and one for every LLM completion,
+Supabase round trip and ``task2events`` call made on its behalf (background
+jobs submitted by a traced request are traced too). It is written to
+``TRACE_DIR/<trace id>.json`` as Chrome trace events (open in Perfetto or
+chrome://tracing) or, with ``TRACE_FORMAT=otel``, as OTLP/JSON. Time inside
+the request span that no child span covers went to validation, our own code
+and serialization.
+
+The profiler samples the event loop thread's stack every ``PROFILE_INTERVAL``
+seconds while the request runs and writes ``TRACE_DIR/<trace id>.collapsed``
+in the folded format read by flamegraph.pl and speedscope. The loop is
+shared, so samples from concurrent requests land in the same file; profile
+on a quiet instance for a clean picture.
+"""
+
+import asyncio
+import json
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from urllib.parse import urlsplit
+
+TRACING = os.getenv("TRACING", "0") == "1"
+TRACE_DIR = os.getenv("TRACE_DIR", "traces")
+TRACE_FORMAT = os.getenv("TRACE_FORMAT", "chrome")
+TRACE_SAMPLE_RATE = float(os.getenv("TRACE_SAMPLE_RATE", "0"))
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+PROFILE_INTERVAL = float(os.getenv("PROFILE_INTERVAL", "0.005"))
+
+_trace = ContextVar("trace", default=None)
+_parent_span = ContextVar("parent_span", default=None)
+
+
+def _new_id(bits):
+    return f"{random.getrandbits(bits):0{bits // 4}x}"
+
+
+def _track():
+    """Identity of the running task (or thread), one timeline row each"""
+    try:
+        task = asyncio.current_task()
+    except RuntimeError:
+        task = None
+    return id(task) if task is not None else threading.get_ident()
+
+
+class Trace:
+    def __init__(self, name) -> None:
+        self.name = name
+        self.trace_id = _new_id(128)
+        self.spans = []
+
+    def add(self, name, start_ns, end_ns, attributes, span_id=None, parent=None):
+        self.spans.append(
+            {
+                "name": name,
+                "span_id": span_id or _new_id(64),
+                "parent": parent if parent is not None else _parent_span.get(),
+                "start": start_ns,
+                "end": end_ns,
+                "track": _track(),
+                "attributes": attributes,
+            }
+        )
+
+    def chrome(self):
+        tracks = {}
+        events = []
+        for span in sorted(self.spans, key=lambda span: span["start"]):
+            tid = tracks.setdefault(span["track"], len(tracks) + 1)
+            events.append(
+                {
+                    "name": span["name"],
+                    "ph": "X",
+                    "ts": span["start"] / 1000,
+                    "dur": (span["end"] - span["start"]) / 1000,
+                    "pid": os.getpid(),
+                    "tid": tid,
+                    "args": span["attributes"],
+                }
+            )
+        return {"traceEvents": events, "otherData": {"trace_id": self.trace_id}}
+
+    def otel(self):
+        def attribute(key, value):
+            if isinstance(value, bool):
+                return {"key": key, "value": {"boolValue": value}}
+            if isinstance(value, int):
+                return {"key": key, "value": {"intValue": str(value)}}
+            if isinstance(value, float):
+                return {"key": key, "value": {"doubleValue": value}}
+            return {"key": key, "value": {"stringValue": str(value)}}
+
+        spans = [
+            {
+                "traceId": self.trace_id,
+                "spanId": span["span_id"],
+                "parentSpanId": span["parent"] or "",
+                "name": span["name"],
+                "kind": 1,
+                "startTimeUnixNano": str(span["start"]),
+                "endTimeUnixNano": str(span["end"]),
+                "attributes": [
+                    attribute(key, value) for key, value in span["attributes"].items()
+                ],
+            }
+            for span in self.spans
+        ]
+        return {
+            "resourceSpans": [
+                {
+                    "resource": {
+                        "attributes": [attribute("service.name", "goalreacher-backend")]
+                    },
+                    "scopeSpans": [{"scope": {"name": "tracing"}, "spans": spans}],
+                }
+            ]
+        }
+
+    def export(self, directory=TRACE_DIR, fmt=TRACE_FORMAT):
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f"{self.trace_id}.json")
+        with open(path, "w") as f:
+            json.dump(self.otel() if fmt == "otel" else self.chrome(), f)
+        return path
+
+
+def current_trace():
+    return _trace.get()
+
+
+@contextmanager
+def span(name, **attributes):
+    """Record the enclosed block as a child of the current span.
+
+    Yields the attribute dict so results can be attached before it closes.
+    Free when the current request isn't traced.
+    """
+    trace = _trace.get()
+    if trace is None:
+        yield attributes
+        return
+    span_id = _new_id(64)
+    parent = _parent_span.get()
+    token = _parent_span.set(span_id)
+    start = time.time_ns()
+    try:
+        yield attributes
+    except BaseException as e:
+        attributes["error"] = type(e).__name__
+        raise
+    finally:
+        _parent_span.reset(token)
+        trace.add(name, start, time.time_ns(), attributes, span_id, parent)
+
+
+def record(name, start_ns, end_ns, **attributes):
+    """Add an already finished span, for code that can't wrap a block"""
+    trace = _trace.get()
+    if trace is not None:
+        trace.add(name, start_ns, end_ns, attributes)
+
+
+@contextmanager
+def traced(name, enabled=True, directory=TRACE_DIR, **attributes):
+    """Trace the enclosed block as its own root span and export it"""
+    if not enabled:
+        yield None
+        return
+    trace = Trace(name)
+    root = _new_id(64)
+    token = _trace.set(trace)
+    parent_token = _parent_span.set(root)
+    start = time.time_ns()
+    try:
+        yield trace
+    finally:
+        _parent_span.reset(parent_token)
+        _trace.reset(token)
+        # trace.name may have been refined while the block ran
+        trace.add(trace.name, start, time.time_ns(), attributes, root, parent="")
+        trace.export(directory)
+
+
+class Profiler:
+    """Samples one thread's Python stack on a background thread"""
+
+    def __init__(self, thread_id, interval=PROFILE_INTERVAL) -> None:
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _sample(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(
+                    f"{code.co_name} ({os.path.basename(code.co_filename)}"
+                    f":{frame.f_lineno})"
+                )
+                frame = frame.f_back
+            if stack:
+                self.stacks[";".join(reversed(stack))] += 1
+
+    def export(self, path):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, "w") as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+        return path
+
+
+def _supabase_span_name(request):
+    path = urlsplit(str(request.url)).path
+    _, _, rest = path.partition("/rest/v1/")
+    return f"supabase {request.method} {rest or path}"
+
+
+async def _supabase_request_started(request):
+    if _trace.get() is not None:
+        request.extensions["trace_started"] = time.time_ns()
+
+
+async def _supabase_response_received(response):
+    started = response.request.extensions.get("trace_started")
+    if started is not None:
+        record(
+            _supabase_span_name(response.request),
+            started,
+            time.time_ns(),
+            status=response.status_code,
+        )
+
+
+# httpx event_hooks for the client the Supabase SDK sends its requests through
+SUPABASE_TRACE_HOOKS = {
+    "request": [_supabase_request_started],
+    "response": [_supabase_response_received],
+}
+
+
+class TracingMiddleware:
+    """ASGI middleware that traces and/or profiles selected requests"""
+
+    def __init__(self, app) -> None:
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if not TRACING or scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        headers = dict(scope["headers"])
+        trace_it = (
+            headers.get(b"x-trace") == b"1" or random.random() < TRACE_SAMPLE_RATE
+        )
+        profile_it = (
+            headers.get(b"x-profile") == b"1" or random.random() < PROFILE_SAMPLE_RATE
+        )
+        if not trace_it and not profile_it:
+            return await self.app(scope, receive, send)
+
+        profiler = None
+        if profile_it:
+            profiler = Profiler(threading.get_ident())
+            profiler.start()
+        with traced(f"{scope['method']} {scope['path']}", trace_it) as trace:
+            trace_id = trace.trace_id if trace is not None else _new_id(128)
+
+            async def send_wrapper(message):
+                if message["type"] == "http.response.start":
+                    message["headers"] = list(message.get("headers", [])) + [
+                        (b"x-trace-id", trace_id.encode())
+                    ]
+                await send(message)
+
+            try:
+                await self.app(scope, receive, send_wrapper)
+            finally:
+                route = scope.get("route")
+                if trace is not None and route is not None:
+                    trace.name = f"{scope['method']} {route.path}"
+                if profiler is not None:
+                    profiler.stop()
+                    profiler.export(os.path.join(TRACE_DIR, f"{trace_id}.collapsed"))
@@ -1,27 +1,246 @@
-from datetime import datetime
+import os
+import re
+import time
+from datetime import datetime, timedelta, timezone
+from functools import lru_cache
+from itertools import islice, takewhile
 
-from dateutil.rrule import rrulestr
+from metrics import TASK2EVENTS_DURATION, TASK2EVENTS_OCCURRENCES
+from tracing import span
 
+# Only occurrences within this window from now are materialised as rows;
+# later ones are created by extend_events as time advances.
+EVENT_HORIZON_DAYS = int(os.getenv("EVENT_HORIZON_DAYS", "56"))
+# Hard cap on the number of event rows a single task can ever produce
+MAX_EVENTS_PER_TASK = int(os.getenv("MAX_EVENTS_PER_TASK", "366"))
+# Compute simple DAILY/WEEKLY rules with NumPy instead of dateutil
+FAST_RRULE = os.getenv("FAST_RRULE", "1") != "0"
 
-def task2events(tasks):
-    events = []
+WEEKDAYS = {"MO": 0, "TU": 1, "WE": 2, "TH": 3, "FR": 4, "SA": 5, "SU": 6}
+
+# numpy and dateutil are imported where they are used, so that importing the
+# app doesn't pay for them before the first plan is expanded
+
+
+def horizon_end(start, now=None, days=None):
+    """End of the materialisation window for a task starting at ``start``"""
+    days = EVENT_HORIZON_DAYS if days is None else days
+    now = now or datetime.now(start.tzinfo)
+    if (now.tzinfo is None) != (start.tzinfo is None):
+        now = now.replace(tzinfo=start.tzinfo)
+    return max(now, start) + timedelta(days=days)
+
+
+@lru_cache(maxsize=1024)
+def simple_rule(rrule_str):
+    """Parse ``FREQ=DAILY|WEEKLY;INTERVAL;COUNT;BYDAY;WKST`` rules.
+
+    Returns ``(freq, interval, count, byday, wkst)`` or ``None`` when the rule
+    uses anything else and has to go through dateutil.
+    """
+    rule = rrule_str.strip()
+    if rule.upper().startswith("RRULE:"):
+        rule = rule[6:]
+    if not rule or "\n" in rule or ":" in rule:
+        return None
+    parts = {}
+    for part in rule.upper().split(";"):
+        key, sep, value = part.partition("=")
+        if not sep or key in parts:
+            return None
+        parts[key] = value
+    if not set(parts) <= {"FREQ", "INTERVAL", "COUNT", "BYDAY", "WKST"}:
+        return None
+    freq = parts.get("FREQ")
+    if freq not in ("DAILY", "WEEKLY"):
+        return None
+    try:
+        interval = int(parts.get("INTERVAL", "1"))
+        count = int(parts["COUNT"]) if "COUNT" in parts else None
+    except ValueError:
+        return None
+    if interval < 1 or (count is not None and count < 1):
+        return None
+    byday = None
+    if "BYDAY" in parts:
+        if freq != "WEEKLY":
+            return None
+        days = parts["BYDAY"].split(",")
+        if not all(day in WEEKDAYS for day in days):
+            return None
+        byday = tuple(sorted({WEEKDAYS[day] for day in days}))
+    wkst = WEEKDAYS.get(parts.get("WKST", "MO"))
+    if wkst is None:
+        return None
+    return freq, interval, count, byday, wkst
+
+
+def _wall_time(dt, tzinfo):
+    import numpy as np
+
+    if dt.tzinfo is not None and tzinfo is not None:
+        dt = dt.astimezone(tzinfo)
+    return np.datetime64(dt.replace(tzinfo=None), "s")
+
+
+def fast_occurrences(rule, start, after, until):
+    """All occurrence starts of a simple rule as naive wall-clock
+    ``datetime64[s]`` values in ``(after, until]``, computed in one batch."""
+    import numpy as np
+
+    one_day = np.timedelta64(1, "D")
+    freq, interval, count, byday, wkst = rule
+    first = np.datetime64(start.replace(tzinfo=None), "s")
+    last = _wall_time(until, start.tzinfo)
+    if last < first:
+        return np.empty(0, dtype="datetime64[s]")
+    span_days = int((last - first) // one_day)
+
+    if freq == "DAILY":
+        n = span_days // interval + 1
+        if count is not None:
+            n = min(n, count)
+        starts = first + np.arange(n) * (interval * one_day)
+    else:
+        byday = byday or (start.weekday(),)
+        offsets = np.array(sorted((day - wkst) % 7 for day in byday)) * one_day
+        week_start = first - ((start.weekday() - wkst) % 7) * one_day
+        weeks = int((last - week_start) // one_day) // (7 * interval) + 1
+        if count is not None:
+            weeks = min(weeks, -(-count // len(byday)) + 1)
+        week_starts = week_start + np.arange(weeks) * (7 * interval * one_day)
+        starts = (week_starts[:, None] + offsets[None, :]).ravel()
+        starts = starts[starts >= first]
+        if count is not None:
+            starts = starts[:count]
+
+    starts = starts[starts <= last]
+    if after is not None:
+        starts = starts[starts > _wall_time(after, start.tzinfo)]
+    return starts
+
+
+def fast_task_events(task, rule, start, duration, after, until, limit):
+    import numpy as np
+
+    starts = fast_occurrences(rule, start, after, until)[: max(limit, 0)]
+    ends = starts + np.timedelta64(duration)
+    # Fixed offsets only, so every occurrence shares the start's UTC offset
+    suffix = start.isoformat()[19:]
+    start_strs = np.char.add(np.datetime_as_string(starts, unit="s"), suffix)
+    end_strs = np.char.add(np.datetime_as_string(ends, unit="s"), suffix)
+    task_id = task["id"]
+    title = task["name"]
+    return [
+        {
+            "task_id": task_id,
+            "title": title,
+            "start": occurrence_start,
+            "end": occurrence_end,
+            "isDone": False,
+        }
+        for occurrence_start, occurrence_end in zip(
+            start_strs.tolist(), end_strs.tolist()
+        )
+    ]
+
+
+def iter_task_events(task, after=None, until=None, limit=MAX_EVENTS_PER_TASK):
+    """Lazily yield event rows for one task.
+
+    Only occurrences starting strictly after ``after`` (if given) and no later
+    than ``until`` (default: the horizon window) are produced, and never more
+    than ``limit`` of them, so unbounded RRULEs stay cheap.
+    """
+    start = datetime.fromisoformat(task["start_timestamptz"])
+    end = datetime.fromisoformat(task["end_timestamptz"])
+    duration = end - start
+    rrule_str = task["recurrence"]
+    until = until or horizon_end(start)
+
+    rule = simple_rule(rrule_str) if FAST_RRULE else None
+    if (
+        rule is not None
+        and start.microsecond == 0
+        and duration.microseconds == 0
+        and (start.tzinfo is None or isinstance(start.tzinfo, timezone))
+    ):
+        yield from fast_task_events(task, rule, start, duration, after, until, limit)
+        return
+
+    from dateutil.rrule import rrulestr
+
+    rule = rrulestr(rrule_str, dtstart=start)
+    occurrences = rule.xafter(after) if after is not None else iter(rule)
+    occurrences = takewhile(lambda occurrence: occurrence <= until, occurrences)
+    for occurrence_start in islice(occurrences, max(limit, 0)):
+        occurrence_end = occurrence_start + duration
+        yield {
+            "task_id": task["id"],
+            "title": task["name"],
+            "start": occurrence_start.isoformat(),
+            "end": occurrence_end.isoformat(),
+            "isDone": False,
+        }
+
+
+def iter_events(tasks, until=None, limit=MAX_EVENTS_PER_TASK):
     for task in tasks:
-        start = datetime.fromisoformat(task["start_timestamptz"])
-        end = datetime.fromisoformat(task["end_timestamptz"])
-        duration = end - start
-        rrule_str = task["recurrence"]
-        rule = rrulestr(rrule_str, dtstart=start)
-
-        for occurrence_start in rule:
-            occurrence_end = occurrence_start + duration
-            events.append(
-                {
-                    "task_id": task["id"],
-                    "title": task["name"],
-                    "start": occurrence_start.isoformat(),
-                    "end": occurrence_end.isoformat(),
-                    "isDone": False,
-                }
-            )
+        yield from iter_task_events(task, until=until, limit=limit)
 
+
+def task2events(tasks, until=None, limit=MAX_EVENTS_PER_TASK):
+    begin = time.perf_counter()
+    with span("task2events", tasks=len(tasks)) as attributes:
+        events = list(iter_events(tasks, until=until, limit=limit))
+        attributes["events"] = len(events)
+    TASK2EVENTS_DURATION.observe(time.perf_counter() - begin)
+    TASK2EVENTS_OCCURRENCES.observe(len(events))
     return events
+
+
+def extend_events(task, last_start, existing, until=None, limit=MAX_EVENTS_PER_TASK):
+    """Rows that move a task's materialised window forward to ``until``.
+
+    ``last_start`` is the start of the latest existing event (ISO string) and
+    ``existing`` the number of rows the task already has; the per-task cap
+    counts both.
+    """
+    after = datetime.fromisoformat(last_start)
+    return list(
+        iter_task_events(task, after=after, until=until, limit=limit - existing)
+    )
+
+
+def milestone_rows(user_id, milestones):
+    """``milestones`` table rows from a MilestoneList dict"""
+    return [
+        {
+            "user_id": user_id,
+            "name": milestone.get("title", ""),
+            "description": milestone.get("description", ""),
+        }
+        for milestone in milestones.get("milestones", [])
+    ]
+
+
+def task_rows(user_id, schedules):
+    """``tasks`` table rows from a ScheduleList dict, one per scheduled event"""
+    rows = []
+    for event in schedules.get("events", []):
+        count = re.search(r"COUNT=(\d+)", event.get("recurrence") or "", re.I)
+        recurrence_time_required = int(count.group(1)) if count else 1
+        start_time = event.get("start", {}).get("dateTime", "")
+        end_time = event.get("end", {}).get("dateTime", "")
+        rows.append(
+            {
+                "user_id": user_id,
+                "name": event.get("summary", ""),
+                "recurrence": event.get("recurrence", ""),
+                "recurrence_time_required": recurrence_time_required,
+                "recurrence_time_done": 0,
+                "start_timestamptz": start_time,
+                "end_timestamptz": end_time,
+            }
+        )
+    return rows
@@ -0,0 +1,88 @@
+import asyncio
+
+
+class WriteBehindBuffer:
+    """Coalesce writes in memory and hand them to ``flush_fn`` in bulk.
+
+    ``put`` only records the latest value per key, so repeated writes to the
+    same key collapse into one. The buffer is flushed every ``interval``
+    seconds, as soon as it holds ``max_size`` keys, and once more on
+    ``aclose``. Values stay readable through ``get`` until they have been
+    written; a failed flush puts them back unless they were overwritten.
+    """
+
+    def __init__(self, flush_fn, interval=1.0, max_size=500) -> None:
+        self.flush_fn = flush_fn
+        self.interval = interval
+        self.max_size = max_size
+        self.pending = {}
+        self.flushing = {}
+        self.flushed = 0
+        self.coalesced = 0
+        self._wakeup = asyncio.Event()
+        self._lock = asyncio.Lock()
+        self._task = None
+
+    def put(self, key, value):
+        if key in self.pending:
+            self.coalesced += 1
+        self.pending[key] = value
+        if len(self.pending) >= self.max_size:
+            self._wakeup.set()
+
+    def get(self, key, default=None):
+        if key in self.pending:
+            return self.pending[key]
+        return self.flushing.get(key, default)
+
+    def snapshot(self):
+        """Every value not yet confirmed as written, newest first"""
+        return {**self.flushing, **self.pending}
+
+    def __contains__(self, key):
+        return key in self.pending or key in self.flushing
+
+    async def flush(self):
+        async with self._lock:
+            if not self.pending:
+                return
+            self.flushing, self.pending = self.pending, {}
+            try:
+                await self.flush_fn(dict(self.flushing))
+                self.flushed += len(self.flushing)
+            except Exception as e:
+                print(f"Write-behind flush failed, will retry: {str(e)}")
+                for key, value in self.flushing.items():
+                    self.pending.setdefault(key, value)
+            finally:
+                self.flushing = {}
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def aclose(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+    def stats(self):
+        return {
+            "pending": len(self.pending),
+            "flushed": self.flushed,
+            "coalesced": self.coalesced,
+        }
@@ -10,11 +10,15 @@ export async function POST(request: NextRequest) {
 
     const currentDate = today || new Date().toISOString().split('T')[0];
 
+    // Forwarded so that admission control can tell users apart
+    const accessToken = request.cookies.get('access_token')?.value;
+
     // Call your Python backend
     const response = await fetch(`${process.env.BACK_URL}/api/generate-schedules`, {
       method: 'POST',
       headers: {
         'Content-Type': 'application/json',
+        ...(accessToken && { 'Authorization': `Bearer ${accessToken}` }),
       },
       body: JSON.stringify({ missions, today: currentDate }),
     });
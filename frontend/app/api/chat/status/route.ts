@@ -8,11 +8,15 @@ export async function POST(request: NextRequest) {
       return NextResponse.json({ error: 'Goal is required' }, { status: 400 });
     }
 
+    // Forwarded so that admission control can tell users apart
+    const accessToken = request.cookies.get('access_token')?.value;
+
     // Call your Python backend
     const response = await fetch(`${process.env.BACK_URL}/api/generate-status`, {
       method: 'POST',
       headers: {
         'Content-Type': 'application/json',
+        ...(accessToken && { 'Authorization': `Bearer ${accessToken}` }),
       },
       body: JSON.stringify({ goal, previous_status, user_description }),
     });
@@ -14,7 +14,12 @@ export async function GET(request: NextRequest) {
     // Transform userData to match backend User model
     const userPayload = {
       user_id: userData.username,  // Map username to user_id
-      email: userData.email
+      email: userData.email,
+      // Optional window/paging, e.g. api/load?start=...&end=... for the visible range
+      start: request.nextUrl.searchParams.get('start') ?? undefined,
+      end: request.nextUrl.searchParams.get('end') ?? undefined,
+      cursor: request.nextUrl.searchParams.get('cursor') ?? undefined,
+      limit: request.nextUrl.searchParams.get('limit') ?? undefined
     };
 
     const response = await fetch(`${process.env.BACK_URL}/api/load-data`, {